@@ -6,18 +6,35 @@ The script creates a dashboard app providing the chart with entry/exit
 positions and additional statistics on the strategy"s performance using
 Plotly Dash.
 """
+import atexit
+import functools
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
 import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
+import numpy as np
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import jsonify, request as http_request
 
 from base_trading.data import Collector, SourceNotSupported
 from base_trading.backtest import BaseTrader
-from base_trading.visual import make_figure, COLORS
+from base_trading.popularity import PopularityTracker
+from base_trading.pyramid import get_pyramid
+from base_trading.visual import make_figure, make_heatmap, COLORS
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.SLATE])
 app.title = 'Base Trading: Buy the Dip, Sell the Hype'
@@ -226,6 +243,27 @@ inputs = html.Div(
             ]
         ),
         html.P(),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupAddon(
+                                "Support Timeframe", addon_type="prepend"),
+                            dbc.Select(
+                                id="support-timeframe",
+                                options=[
+                                    {"label": "Daily", "value": "D"},
+                                    {"label": "Weekly", "value": "W"},
+                                    {"label": "Monthly", "value": "M"}
+                                ],
+                                value="D")
+                        ]
+                    )
+                ),
+            ]
+        ),
+        html.P(),
         dbc.Row(
             [
                 dbc.Col(
@@ -254,6 +292,34 @@ inputs = html.Div(
             ]
         ),
         html.P(),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupAddon("Fee per Trade (%)"),
+                            dbc.Input(id="fee", type="number", value=0,
+                                      min=0, max=100, step=0.01)
+                        ]
+                    )
+                ),
+            ]
+        ),
+        html.P(),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupAddon("Slippage per Trade (%)"),
+                            dbc.Input(id="slippage", type="number", value=0,
+                                      min=0, max=100, step=0.01)
+                        ]
+                    )
+                ),
+            ]
+        ),
+        html.P(),
         dbc.Row(
             dbc.Col(
                 [
@@ -292,6 +358,7 @@ price_graph = html.Div(
     [
         html.H2("Price & Signals"),
         html.P(),
+        html.Div(id="price-preview"),
         dbc.Spinner(html.Div(id="price-graph")),
     ],
     className="jumbotron"
@@ -301,6 +368,7 @@ strat_graph = html.Div(
     [
         html.H2("Portfolio Balance (Base Trading)"),
         html.P(),
+        html.Div(id="strat-preview"),
         dbc.Spinner(html.Div(id="strat-graph"))
     ],
     className="jumbotron"
@@ -310,11 +378,41 @@ table = html.Div(
     [
         html.H2("Performance Comparison"),
         html.P(),
+        html.Div(id="stats-preview"),
         html.Div(id="stats-table")
     ],
     className="jumbotron"
 )
 
+# Grid of the sensitivity heatmap, in %
+BREAK_SUPPORTS = list(range(5, 55, 5))
+BREAK_RESISTS = list(range(10, 110, 10))
+
+sensitivity = html.Div(
+    [
+        html.H2("Parameter Sensitivity"),
+        html.P(),
+        dbc.InputGroup(
+            [
+                dbc.InputGroupAddon("Metric", addon_type="prepend"),
+                dbc.Select(
+                    id="sensitivity-metric",
+                    options=[
+                        {"label": "Sharpe Ratio", "value": "Sharpe Ratio"},
+                        {"label": "Annualized Return (%)",
+                         "value": "Annualized Return (%)"},
+                    ],
+                    value="Sharpe Ratio")
+            ]
+        ),
+        html.P(),
+        html.P("Click a cell to load its parameters into the settings."),
+        dbc.Spinner(dcc.Graph(id="sensitivity-graph",
+                              config={"displaylogo": False})),
+    ],
+    className="jumbotron"
+)
+
 # ------------------------- Footer, Instruction -------------------------------
 
 MAIL_ICON = "https://raw.githubusercontent.com/dang-trung/base-trading" \
@@ -418,15 +516,23 @@ instructions = html.Div(
             "positions you could enter at most at the same time. Every time "
             "you sell, your available number of positions will be refilled."),
         html.P(
-            '4. "Support in (Days)" determines how "strong" your bases are.'),
+            '4. "Support in (Days)" determines how "strong" your bases are. '
+            'With a weekly or monthly "Support Timeframe", it counts weeks or '
+            'months instead.'),
         html.P(
             "5. For the last two parameters, you buy when the price drops "
             "below any support by the first percentage, and sell when it "
             "gets back up and penetrates the previously broken support by "
             "the latter percentage."),
         html.P(
-            "6. You can also choose to view the graph in log or linear scale."),
+            "6. Fees and slippage are charged on the traded value every time "
+            "you buy or sell. You can also choose to view the graph in log or "
+            "linear scale."),
         html.P("7. Submit to see results."),
+        html.P(
+            "8. The Parameter Sensitivity heatmap shows how the strategy "
+            "would have done for other drop/break percentages. Click any "
+            "cell to load its percentages into the settings, then submit."),
         html.H2("What Could Possibly Turn Wrong? "),
         html.P(),
         html.P(
@@ -483,6 +589,8 @@ instructions = html.Div(
 
 app.layout = html.Div(
     [
+        dcc.Store(id="preview-token"),
+        dcc.Store(id="full-token"),
         navbar,
         html.P(),
         html.Div(
@@ -499,7 +607,8 @@ app.layout = html.Div(
                             [
                                 price_graph,
                                 strat_graph,
-                                table
+                                table,
+                                sensitivity
                             ], width=8
                         ),
                         dbc.Col(
@@ -520,14 +629,142 @@ app.layout = html.Div(
 )
 
 
+# Directory of the historical prices cached by Collector
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+
+
+@functools.lru_cache(maxsize=16)
+def load_data(ticker, source, start, end):
+    """
+    Historical prices of a ticker, from the cache in `data` or the source,
+    kept in memory per ticker and date range.
+    """
+    data_path = os.path.join(DATA_DIR, f"{ticker}.csv")
+    collector = Collector(ticker, source, start, end, data_path)
+    return collector.get_historical()
+
+
+# Seconds the preview of long histories may take before the exact results
+# are computed, and measured cost of a full backtest per bar (updated after
+# every full run)
+PREVIEW_BUDGET = float(os.environ.get("PREVIEW_BUDGET", 1.0))
+_full_cost = {"seconds_per_bar": 5e-5}
+
+# Settings of a backtest request, in the order of the form (the price scale
+# only changes how results are drawn, so it is left out)
+REQUEST_FIELDS = ("ticker", "source", "start", "end", "price", "init_cash",
+                  "max_pos", "valid_days", "timeframe", "break_support",
+                  "break_resist", "fee", "slippage")
+
+
+def preview_stride(n_bars):
+    """
+    Every how many bars a preview keeps to fit in the time budget, 1 if the
+    full backtest already does.
+    """
+    affordable_bars = PREVIEW_BUDGET / _full_cost["seconds_per_bar"]
+    return max(1, math.ceil(n_bars / affordable_bars))
+
+
+def run_backtest(data, ticker, price, init_cash, max_pos, valid_days,
+                 timeframe, break_support, break_resist, fee, slippage, scale,
+                 stride=1):
+    """
+    Backtest and make the figures, either exactly or on every `stride`-th
+    bar with day-based parameters scaled accordingly (for previews).
+    """
+    # supports on daily bars are found on the data itself
+    timeframe = None if timeframe == "D" else timeframe
+    if stride > 1:
+        last = len(data) - 1
+        data = data.iloc[list(range(0, last, stride)) + [last]]
+        pyramid = None
+        if timeframe is None:
+            valid_days = max(valid_days // stride, 1)
+    else:
+        pyramid = get_pyramid(ticker, data) if timeframe else None
+
+    base_trader = BaseTrader(
+        price, valid_days, break_support / 100, break_resist / 100, max_pos,
+        init_cash, window=max(30 // stride, 2), timeframe=timeframe,
+        periods=365 / stride, fee=fee / 100, slippage=slippage / 100)
+    data, stats = base_trader.execute(data, pyramid)
+
+    figure, strat = make_figure(data, ticker, price, COLORS, scale,
+                                base_trader.trades)
+
+    figure = dcc.Graph(figure=figure, config={"displaylogo": False})
+    strat = dcc.Graph(figure=strat, config={"displaylogo": False})
+    stats = dbc.Table.from_dataframe(stats)
+    return figure, strat, stats
+
+
+@app.callback(
+    [
+        Output("price-preview", "children"),
+        Output("strat-preview", "children"),
+        Output("stats-preview", "children"),
+        Output("preview-token", "data"),
+    ],
+    [
+        Input("submit-button", "n_clicks"),
+    ],
+    [
+        State("ticker", "value"),
+        State("data-source", "value"),
+        State("start-date", "value"),
+        State("end-date", "value"),
+        State("marked-price", "value"),
+        State("init-cash", "value"),
+        State("max-pos", "value"),
+        State("valid-days", "value"),
+        State("support-timeframe", "value"),
+        State("break-support", "value"),
+        State("break-resist", "value"),
+        State("fee", "value"),
+        State("slippage", "value"),
+        State("graph-scale", "value"),
+    ]
+)
+def update_preview(n_clicks, ticker, source, start, end, price, init_cash,
+                   max_pos, valid_days, timeframe, break_support,
+                   break_resist, fee, slippage, scale):
+    """
+    Callback function to show a coarse preview of long histories within
+    the time budget, then hand over to the exact backtest. No preview is
+    needed if the exact results are cached already.
+    """
+    if cached_results(ticker, source, start, end, price, init_cash, max_pos,
+                      valid_days, timeframe, break_support, break_resist,
+                      fee, slippage, scale) is not None:
+        return None, None, None, n_clicks
+
+    try:
+        data = load_data(ticker, source, start, end)
+    except SourceNotSupported:
+        return None, None, None, n_clicks
+
+    stride = preview_stride(len(data))
+    if stride == 1:
+        return None, None, None, n_clicks
+
+    figure, strat, stats = run_backtest(
+        data, ticker, price, init_cash, max_pos, valid_days, timeframe,
+        break_support, break_resist, fee, slippage, scale, stride)
+    note = dbc.Alert(f"Preview on every {stride} bars, computing exact "
+                     f"results...", color="secondary")
+    return [note, figure], [note, strat], [note, stats], n_clicks
+
+
 @app.callback(
     [
         Output("price-graph", "children"),
         Output("strat-graph", "children"),
         Output("stats-table", "children"),
+        Output("full-token", "data"),
     ],
     [
-        Input("submit-button", "n_clicks"),
+        Input("preview-token", "data"),
     ],
     [
         State("ticker", "value"),
@@ -538,44 +775,175 @@ app.layout = html.Div(
         State("init-cash", "value"),
         State("max-pos", "value"),
         State("valid-days", "value"),
+        State("support-timeframe", "value"),
         State("break-support", "value"),
         State("break-resist", "value"),
+        State("fee", "value"),
+        State("slippage", "value"),
         State("graph-scale", "value"),
     ]
 )
-def update_strat(n_clicks, ticker, source, start, end, price, init_cash,
-                 max_pos, valid_days, break_support, break_resist, scale):
+def update_strat(preview_token, ticker, source, start, end, price, init_cash,
+                 max_pos, valid_days, timeframe, break_support, break_resist,
+                 fee, slippage, scale):
     """
     Callback functions to generate the price graph with signals and the
     graph of portfolio performance if base trading is executed.
     """
-    data_path = os.path.join("data", f"{ticker}.csv")
-    break_support /= 100
-    break_resist /= 100
+    if preview_token is None:
+        raise PreventUpdate
+    request = (ticker, source, start, end, price, init_cash, max_pos,
+               valid_days, timeframe, break_support, break_resist, fee,
+               slippage)
     try:
-        collector = Collector(ticker, source, start, end, data_path)
+        figure, strat, stats = full_backtest(*request, scale)
     except SourceNotSupported:
         error_message = dbc.Alert(
             "Sorry! Only Yahoo Finance is supported at the moment.",
             color="primary"
         )
-        return error_message, error_message, error_message
+        return error_message, error_message, error_message, preview_token
 
-    data = collector.get_historical()
+    popularity.record(dict(zip(REQUEST_FIELDS, request)))
+    return figure, strat, stats, preview_token
 
-    base_trader = BaseTrader(
-        price, valid_days, break_support, break_resist, max_pos, init_cash)
-    data, stats = base_trader.execute(data)
 
-    figure, strat = make_figure(data, ticker, price, COLORS, scale)
+@app.callback(
+    [
+        Output("price-preview", "hidden"),
+        Output("strat-preview", "hidden"),
+        Output("stats-preview", "hidden"),
+    ],
+    [
+        Input("preview-token", "data"),
+        Input("full-token", "data"),
+    ],
+)
+def toggle_preview(preview_token, full_token):
+    """
+    Hide the preview once the exact results of the same submission are
+    shown.
+    """
+    hidden = preview_token is None or full_token == preview_token
+    return hidden, hidden, hidden
 
-    figure = dcc.Graph(figure=figure, config={"displaylogo": False})
-    strat = dcc.Graph(figure=strat, config={"displaylogo": False})
-    stats = dbc.Table.from_dataframe(stats)
 
-    if n_clicks:
-        return figure, strat, stats
-    return figure, strat, stats
+# Exact results of the latest requests, least recently used first
+RESULTS_CACHE_SIZE = 32
+_results = OrderedDict()
+_results_info = {"hits": 0, "misses": 0}
+_results_lock = threading.Lock()
+
+
+def cached_results(*request):
+    """
+    Exact backtest and figures of a request if they are cached, None
+    otherwise.
+    """
+    with _results_lock:
+        return _results.get(request)
+
+
+def full_backtest(*request):
+    """
+    Exact backtest and figures, cached per set of parameters (the arguments
+    of `run_backtest` without the data).
+    """
+    with _results_lock:
+        results = _results.get(request)
+        if results is not None:
+            _results.move_to_end(request)
+            _results_info["hits"] += 1
+            return results
+        _results_info["misses"] += 1
+
+    ticker, source, start, end = request[:4]
+    data = load_data(ticker, source, start, end)
+    started = time.perf_counter()
+    results = run_backtest(data, ticker, *request[4:])
+    seconds_per_bar = (time.perf_counter() - started) / max(len(data), 1)
+    _full_cost["seconds_per_bar"] = (0.8 * _full_cost["seconds_per_bar"]
+                                     + 0.2 * seconds_per_bar)
+
+    with _results_lock:
+        _results[request] = results
+        if len(_results) > RESULTS_CACHE_SIZE:
+            _results.popitem(last=False)
+    return results
+
+
+@functools.lru_cache(maxsize=32)
+def sensitivity_grid(ticker, source, start, end, price, init_cash, max_pos,
+                     valid_days, timeframe, fee, slippage):
+    """
+    Performance of every (break_support, break_resist) pair of the
+    sensitivity grid, computed in one batched evaluation and cached per
+    ticker, date range and remaining parameters.
+    """
+    data = load_data(ticker, source, start, end)
+    pyramid = get_pyramid(ticker, data) if timeframe else None
+    base_trader = BaseTrader(price, valid_days, max_pos=max_pos,
+                             init_cash=init_cash, timeframe=timeframe,
+                             fee=fee / 100, slippage=slippage / 100)
+    grid = base_trader.grid(data, [x / 100 for x in BREAK_SUPPORTS],
+                            [x / 100 for x in BREAK_RESISTS], pyramid)
+    grid.index = grid.index.set_levels(
+        [BREAK_SUPPORTS, BREAK_RESISTS], verify_integrity=False)
+    return grid
+
+
+@app.callback(
+    Output("sensitivity-graph", "figure"),
+    [
+        Input("submit-button", "n_clicks"),
+        Input("sensitivity-metric", "value"),
+    ],
+    [
+        State("ticker", "value"),
+        State("data-source", "value"),
+        State("start-date", "value"),
+        State("end-date", "value"),
+        State("marked-price", "value"),
+        State("init-cash", "value"),
+        State("max-pos", "value"),
+        State("valid-days", "value"),
+        State("support-timeframe", "value"),
+        State("fee", "value"),
+        State("slippage", "value"),
+    ]
+)
+def update_sensitivity(n_clicks, metric, ticker, source, start, end, price,
+                       init_cash, max_pos, valid_days, timeframe, fee,
+                       slippage):
+    """
+    Callback function to generate the heatmap of a metric over the grid
+    of drop/break from support percentages.
+    """
+    timeframe = None if timeframe == "D" else timeframe
+    try:
+        grid = sensitivity_grid(ticker, source, start, end, price, init_cash,
+                                max_pos, valid_days, timeframe, fee,
+                                slippage)
+    except SourceNotSupported:
+        return {}
+    return make_heatmap(grid, metric, COLORS)
+
+
+@app.callback(
+    [
+        Output("break-support", "value"),
+        Output("break-resist", "value"),
+    ],
+    [Input("sensitivity-graph", "clickData")],
+)
+def load_parameters(click_data):
+    """
+    Load the parameters of the clicked heatmap cell into the settings.
+    """
+    if not click_data:
+        raise PreventUpdate
+    point = click_data["points"][0]
+    return point["y"], point["x"]
 
 
 @app.callback(
@@ -592,5 +960,209 @@ def toggle_collapse(n, is_open):
     return is_open
 
 
+# -------------------------------- JSON API ----------------------------------
+# Parameters of BaseTrader accepted by the API, in the library's units
+# (fractions, not percentages)
+API_PARAMETERS = ("valid_days", "break_support", "break_resist", "max_pos",
+                  "init_cash", "timeframe", "window", "periods", "fee",
+                  "slippage")
+API_WORKERS = int(os.environ.get("API_WORKERS", 4))
+API_MAX_SPECS = int(os.environ.get("API_MAX_SPECS", 100))
+API_MAX_EQUITY_POINTS = int(os.environ.get("API_MAX_EQUITY_POINTS", 10000))
+
+
+def _number(x):
+    # JSON has no NaN/inf
+    x = float(x)
+    return x if math.isfinite(x) else None
+
+
+def _data_key(spec):
+    return (spec["ticker"], spec.get("source", "yahoo"), spec["start"],
+            spec["end"])
+
+
+def evaluate_spec(spec, data, equity_points=0):
+    """
+    Backtest one spec of an API batch on its historical prices.
+
+    Returns
+    -------
+    dict
+        Numeric metrics of Buy & Hold and Base Trading, number of trades and,
+        if `equity_points` > 0, both equity curves sampled on that many
+        evenly spaced bars (every bar at most)
+    """
+    unknown = set(spec) - {"ticker", "source", "start", "end", "price",
+                           *API_PARAMETERS}
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    params = {name: spec[name] for name in API_PARAMETERS if name in spec}
+    if params.get("timeframe") == "D":
+        params["timeframe"] = None
+    price = spec.get("price", "Close")
+    base_trader = BaseTrader(price, **params)
+    pyramid = (get_pyramid(spec["ticker"], data)
+               if base_trader.timeframe else None)
+    performance, equity = base_trader.evaluate(data, pyramid)
+
+    result = {
+        "stats": {strategy: {metric: _number(value)
+                             for metric, value in metrics.items()}
+                  for strategy, metrics in performance.items()},
+        "trades": len(base_trader.trades),
+    }
+    if equity_points > 0:
+        ix = np.unique(np.linspace(0, len(data) - 1,
+                                   min(equity_points, len(data)), dtype=int))
+        result["equity"] = {
+            "Date": data["Date"].iloc[ix].dt.strftime("%Y-%m-%d").tolist(),
+            **{strategy: [_number(x) for x in values[ix]]
+               for strategy, values in equity.items()}}
+    return result
+
+
+@server.route("/api/backtest", methods=["POST"])
+def api_backtest():
+    """
+    Backtest a batch of specs, concurrently, without building any figure.
+
+    The JSON body is either a list of specs or an object with `specs` and
+    `equity_points` (number of points of the returned equity curves, none
+    by default, at most `API_MAX_EQUITY_POINTS`), e.g.:
+        {"specs": [{"ticker": "BTC-USD", "start": "2018-01-01",
+                    "end": "2021-01-01", "price": "Close",
+                    "valid_days": 20, "break_support": 0.1, "fee": 0.001}],
+         "equity_points": 100}
+
+    Historical prices are loaded once per (ticker, source, start, end). The
+    response holds one result per spec, in order, with an `error` instead
+    for specs that could not be backtested.
+    """
+    body = http_request.get_json(silent=True)
+    if isinstance(body, list):
+        body = {"specs": body}
+    if not isinstance(body, dict) or not isinstance(body.get("specs"), list):
+        return jsonify(error="Expected a list of specs."), 400
+    specs = body["specs"]
+    if not 0 < len(specs) <= API_MAX_SPECS:
+        return jsonify(
+            error=f"Expected 1 to {API_MAX_SPECS} specs per batch."), 400
+    try:
+        equity_points = int(body.get("equity_points", 0))
+    except (TypeError, ValueError, OverflowError):
+        return jsonify(error="equity_points must be an integer."), 400
+    if not 0 <= equity_points <= API_MAX_EQUITY_POINTS:
+        return jsonify(error=f"equity_points must be between 0 and "
+                             f"{API_MAX_EQUITY_POINTS}."), 400
+
+    def load(key):
+        try:
+            return load_data(*key)
+        except Exception as e:
+            return e
+
+    def run(spec):
+        try:
+            data = datasets[_data_key(spec)]
+            if isinstance(data, Exception):
+                raise data
+            return evaluate_spec(spec, data, equity_points)
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    keys, results = set(), [None] * len(specs)
+    for k, spec in enumerate(specs):
+        try:
+            keys.add(_data_key(spec))
+        except (KeyError, TypeError):
+            results[k] = {"error": "Specs need a ticker, start and end."}
+    keys = list(keys)
+    with ThreadPoolExecutor(max_workers=API_WORKERS) as executor:
+        datasets = dict(zip(keys, executor.map(load, keys)))
+        pending = [k for k, result in enumerate(results) if result is None]
+        for k, result in zip(pending,
+                             executor.map(run, [specs[k] for k in pending])):
+            results[k] = result
+    return jsonify(results=results)
+
+
+@server.route("/api/stats", methods=["GET"])
+def api_stats():
+    """
+    Cache statistics and memory use of the worker process serving the
+    request, e.g. for load tests.
+    """
+    caches = {}
+    for name, cached in [("load_data", load_data),
+                         ("sensitivity_grid", sensitivity_grid)]:
+        info = cached.cache_info()
+        caches[name] = {"hits": info.hits, "misses": info.misses,
+                        "size": info.currsize}
+    with _results_lock:
+        caches["full_backtest"] = {**_results_info, "size": len(_results)}
+    max_rss = None
+    if resource is not None:  # kilobytes on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return jsonify(pid=os.getpid(), max_rss_kb=max_rss, caches=caches)
+
+
+# ------------------------------ Pre-warming ---------------------------------
+# Requests are counted to warm the caches with the most popular ones when the
+# app starts, in the background so that the server is ready right away. The
+# caches are kept in memory per process, so every gunicorn worker warms its
+# own: startup costs PREWARM_TOP backtests and sensitivity grids per worker
+# (prices are only fetched once, see Collector)
+popularity = PopularityTracker(
+    os.environ.get("POPULARITY_PATH", os.path.join(DATA_DIR,
+                                                   "popularity.json")))
+atexit.register(popularity.save)
+PREWARM_TOP = int(os.environ.get("PREWARM_TOP", 10))
+PREWARM_WORKERS = int(os.environ.get("PREWARM_WORKERS", 2))
+
+
+def warm(request):
+    """
+    Compute the backtest and the sensitivity grid of a request ahead of
+    time.
+    """
+    # drawn with the default price scale
+    full_backtest(*(request[field] for field in REQUEST_FIELDS), "log")
+    timeframe = request["timeframe"]
+    sensitivity_grid(
+        request["ticker"], request["source"], request["start"],
+        request["end"], request["price"], request["init_cash"],
+        request["max_pos"], request["valid_days"],
+        None if timeframe == "D" else timeframe, request["fee"],
+        request["slippage"])
+
+
+def prewarm(n=PREWARM_TOP, workers=PREWARM_WORKERS):
+    """
+    Warm the caches with the `n` most popular requests, `workers` at a
+    time.
+
+    Returns
+    -------
+    int
+        Number of requests warmed
+    """
+    warmed = 0
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix="prewarm") as executor:
+        for future in [executor.submit(warm, request)
+                       for request in popularity.top(n)]:
+            try:
+                future.result()
+                warmed += 1
+            except Exception:  # e.g. a ticker no longer available
+                pass
+    return warmed
+
+
+if PREWARM_TOP > 0:
+    threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+
+
 if __name__ == '__main__':
     app.run_server(debug=True)
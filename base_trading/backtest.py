@@ -6,10 +6,31 @@ The script finds dates when prices are supported and computes entry/exit price
 according to Base Trading strategy, as well as does backtesting and computes
 additional performance stats of the strategy.
 """
+import copy
+import itertools
+from collections import deque
+
 import pandas as pd
 import numpy as np
 from scipy.signal import argrelextrema
 
+from base_trading.columnar import from_columns, to_columns
+from base_trading.metrics import FLAT_VOLATILITY, StreamingAnalytics
+from base_trading.pyramid import ResamplePyramid
+
+RETURNS = {"Buy & Hold": "Market Return", "Base Trading": "Strategy Return"}
+PRICES = ("Open", "High", "Low", "Close")
+
+# One row per lot bought; exit_ix is -1 and exit_price NaN while still open
+TRADE_DTYPE = np.dtype([
+    ("entry_ix", np.int64),
+    ("exit_ix", np.int64),
+    ("support", np.float64),
+    ("entry_price", np.float64),
+    ("exit_price", np.float64),
+    ("size", np.float64),
+])
+
 
 class BaseTrader:
     """
@@ -21,11 +42,31 @@ class BaseTrader:
     execute()
         Wrapper that does everything in bulk (find supports, compute
         entry/exit prices and backtest)
+
+    compare()
+        Backtest several price columns at once and compare the results
+
+    evaluate()
+        Numeric performance and equity curves only, without the rolling
+        analytics and added columns of execute()
+
+    grid()
+        Backtest a grid of break_support/break_resist pairs at once
+
+    execute_chunked()
+        Backtest a history larger than memory, block by block
+
+    Attributes
+    ----------
+    trades : ndarray
+        Trade ledger of the last execution, a structured array of
+        `TRADE_DTYPE` with one row per lot, matched first in, first out
     """
 
     def __init__(self, price="Close", valid_days=20,
                  break_support=0.1, break_resist=0.4, max_pos=5,
-                 init_cash=10000):
+                 init_cash=10000, window=30, timeframe=None, periods=365,
+                 fee=0.0, slippage=0.0):
         """
         Parameters
         ----------
@@ -39,6 +80,20 @@ class BaseTrader:
         break_resist : float, default=0.1
             % Penetrate from a support (previously used to make an entry) to
             exit the position
+        window : int, default=30
+            Number of days used for rolling volatility and Sharpe ratio
+        timeframe : str, default=None
+            pandas offset alias (e.g. "W", "M") of the timeframe supports are
+            found on, in which case `valid_days` counts bars of that
+            timeframe. Supports are found on the trading bars if None.
+        periods : int or float, default=365
+            Number of trading bars per year, used to annualize returns and
+            volatility
+        fee : float, default=0.0
+            Fees paid on every buy/sell, as a fraction of the traded value
+        slippage : float, default=0.0
+            Price lost on every buy/sell to slippage, as a fraction of the
+            price
         """
         self.price = price
         self.valid_days = valid_days
@@ -47,35 +102,323 @@ class BaseTrader:
         self.max_pos = max_pos
         self.pos_size = 1 / max_pos
         self.init_cash = init_cash
+        self.window = window
+        self.timeframe = timeframe
+        self.periods = periods
+        self.fee = fee
+        self.slippage = slippage
+        self.cost = fee + slippage
 
-    def execute(self, X):
+    def execute(self, X, pyramid=None):
         """
         Wrapper that does everything in bulk (find supports, compute
         entry/exit prices, backtest)
 
         Parameters
         ----------
-        X : DataFrame
-            Contains the asset's historical prices.
+        X : DataFrame, dict of array-like or pyarrow.Table
+            Contains the asset's historical prices, with a `Date` column (or
+            a DatetimeIndex for DataFrames).
+        pyramid : ResamplePyramid, default=None
+            Cached resamples of the asset's prices, used to find supports
+            when `timeframe` is set. Built from `X` if None.
+
+        Returns
+        -------
+        X_copy : DataFrame, dict or pyarrow.Table
+            Processed version of the input, in the same format, with added
+            columns:
+            Support, Position, Strategy Cumulative Returns,
+            rolling volatility/Sharpe and drawdowns of both strategies, etc.
+
+        stats : DataFrame
+            Contains performance metrics of Base Trading compared to a
+            simple Buy-and-Hold strategy.
+        """
+        columns = to_columns(X)
+        cols = dict(columns)  # new columns are added next to the views
+        self._find_support(cols, pyramid)
+        self._make_support_line(cols)
+        self._make_signal(cols)
+        self._strat_return(cols)
+        self._analytics(cols)
+        dates = cols["Date"]
+        stats = self._simulate(
+            dates[0], dates[-1], len(dates) - 1,
+            {strategy: cols[strategy][-1] for strategy in RETURNS})
+        new_columns = {col: values for col, values in cols.items()
+                       if col not in columns}
+        return from_columns(X, new_columns), stats
+
+    def compare(self, X, prices=PRICES, pyramid=None):
+        """
+        Backtest the strategy on several price columns at once, in one pass
+        over the stacked (bars x price columns) prices.
+
+        Parameters
+        ----------
+        X : DataFrame, dict of array-like or pyarrow.Table
+            Contains the asset's historical prices, like in `execute`.
+        prices : tuple of str, default=("Open", "High", "Low", "Close")
+            Price columns to compare
+        pyramid : ResamplePyramid, default=None
+            Cached resamples of the asset's prices, like in `execute`.
+
+        Returns
+        -------
+        DataFrame
+            Performance metrics of Base Trading for every price column (one
+            row each), with the annualized return of Buy & Hold and the
+            number of trades. Ledgers are kept in `compared_trades`.
+        """
+        cols = to_columns(X)
+        stacked = np.column_stack([cols[price] for price in prices])
+        stacked = stacked.astype(np.float64, copy=False)
+        n = len(stacked)
+
+        stacks = []
+        for price in prices:
+            sup_ix, sup_prices = self._supports(cols, price, pyramid)
+            stacks.append((list(sup_ix[::-1]), list(sup_prices[::-1])))
+        ledgers = self._trade(stacked, stacks)
+        position = np.column_stack([_position(trades, n)
+                                    for trades in ledgers])
+        traded = np.column_stack([_traded(trades, n) for trades in ledgers])
+        returns = _returns(stacked, position, self.init_cash, self.cost,
+                           traded=traded)
+
+        rows = {}
+        for j, price in enumerate(prices):
+            rows[price] = self._column_performance(returns, j, "Base Trading")
+            rows[price]["Buy & Hold Annualized Return (%)"] = (
+                self._column_performance(returns, j, "Buy & Hold")[
+                    "Annualized Return (%)"])
+            rows[price]["Trades"] = len(ledgers[j])
+
+        self.compared_trades = dict(zip(prices, ledgers))
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def evaluate(self, X, pyramid=None):
+        """
+        Backtest the strategy and return raw numbers only: the whole-period
+        metrics and equity curves of both strategies, without rolling
+        analytics, formatting or a copy of the input.
+
+        Parameters
+        ----------
+        X : DataFrame, dict of array-like or pyarrow.Table
+            Contains the asset's historical prices, like in `execute`.
+        pyramid : ResamplePyramid, default=None
+            Cached resamples of the asset's prices, like in `execute`.
+
+        Returns
+        -------
+        performance : dict
+            Performance metrics of Buy & Hold and Base Trading
+        equity : dict
+            Equity curve (one value per bar) of Buy & Hold and Base Trading
+        """
+        cols = to_columns(X)
+        prices = cols[self.price].astype(np.float64, copy=False)
+        n = len(prices)
+
+        sup_ix, sup_prices = self._supports(cols, self.price, pyramid)
+        self.trades = self._trade(
+            prices[:, np.newaxis],
+            [(list(sup_ix[::-1]), list(sup_prices[::-1]))])[0]
+        position = _position(self.trades, n)
+        traded = _traded(self.trades, n)
+        returns = _returns(prices[:, np.newaxis], position[:, np.newaxis],
+                           self.init_cash, self.cost,
+                           traded=traded[:, np.newaxis])
+
+        performance = {strategy: self._column_performance(returns, 0,
+                                                          strategy)
+                       for strategy in RETURNS}
+        equity = {strategy: returns[strategy][:, 0] for strategy in RETURNS}
+        return performance, equity
+
+    def grid(self, X, break_supports, break_resists, pyramid=None):
+        """
+        Backtest every (break_support, break_resist) pair of a grid in one
+        batched pass: supports are found once, and the signals of every
+        pair are computed in the same pass over the bars.
+
+        Parameters
+        ----------
+        X : DataFrame, dict of array-like or pyarrow.Table
+            Contains the asset's historical prices, like in `execute`.
+        break_supports : list of float
+            Values of `break_support` to try
+        break_resists : list of float
+            Values of `break_resist` to try
+        pyramid : ResamplePyramid, default=None
+            Cached resamples of the asset's prices, like in `execute`.
 
         Returns
         -------
-        X_copy : DataFrame
-            Processed version of the input dataframe, with added columns:
-            Support, Bought Price, Sold Price, Strategy Cumulative Returns,
-            etc.
+        DataFrame
+            Performance metrics of Base Trading for every pair, indexed by
+            (Break Support, Break Resist)
+        """
+        cols = to_columns(X)
+        prices = cols[self.price].astype(np.float64, copy=False)
+        n = len(prices)
+        pairs = list(itertools.product(break_supports, break_resists))
+        stacked = np.broadcast_to(prices[:, np.newaxis], (n, len(pairs)))
 
+        sup_ix, sup_prices = self._supports(cols, self.price, pyramid)
+        stacks = [(list(sup_ix[::-1]), list(sup_prices[::-1]))
+                  for _ in pairs]
+        books = []
+        for break_support, break_resist in pairs:
+            trader = copy.copy(self)
+            trader.dip_to_buy = 1 - break_support
+            trader.hype_to_sell = 1 + break_resist
+            books.append(SignalBook(trader))
+        ledgers = self._trade(stacked, stacks, books)
+        position = np.column_stack([_position(trades, n)
+                                    for trades in ledgers])
+        traded = np.column_stack([_traded(trades, n) for trades in ledgers])
+        returns = _returns(stacked, position, self.init_cash, self.cost,
+                           traded=traded)
+
+        rows = [self._column_performance(returns, j, "Base Trading")
+                for j in range(len(pairs))]
+        for row, trades in zip(rows, ledgers):
+            row["Trades"] = len(trades)
+        index = pd.MultiIndex.from_tuples(
+            pairs, names=["Break Support", "Break Resist"])
+        return pd.DataFrame(rows, index=index)
+
+    def execute_chunked(self, blocks, sink=None):
+        """
+        Out-of-core version of `execute`, for histories larger than memory.
+
+        Bars are processed block by block; supports, positions, equity and
+        analytics are carried across blocks, and the last 2 * `valid_days`
+        bars of a block are held back until the bars needed to confirm the
+        supports around them have been read. Results are identical to an
+        in-memory `execute` run, while memory stays bounded by the block
+        size.
+
+        Parameters
+        ----------
+        blocks : iterable of DataFrame, dict of array-like or pyarrow.Table
+            Consecutive blocks of the asset's historical prices, e.g. from
+            data.read_blocks()
+        sink : callable, default=None
+            Called in order with every processed block, a DataFrame with
+            the same columns (and index) as `execute` would return
+
+        Returns
+        -------
         stats : DataFrame
             Contains performance metrics of Base Trading compared to a
             simple Buy-and-Hold strategy.
         """
-        X_copy = X.copy()
-        self._find_support(X_copy)
-        self._make_support_line(X_copy)
-        self._make_signal(X_copy)
-        self._strat_return(X_copy)
-        stats = self._simulate(X_copy)
-        return X_copy, stats
+        if self.timeframe is not None:
+            raise ValueError(
+                "Chunked backtests find supports on the trading bars only.")
+        order = int(self.valid_days)
+        book = SignalBook(self)
+        pending = deque()  # (index, price) of supports not valid yet
+        carry = {}
+        self.analytics = {strategy: StreamingAnalytics(self.window,
+                                                       self.periods)
+                          for strategy in RETURNS}
+
+        buffer, support = None, np.empty(0)
+        buf0, sup_done, done = 0, 0, 0  # absolute bar indices
+        position = 0.0
+        start, end = None, None
+
+        def advance(last):
+            nonlocal buffer, support, buf0, sup_done, done, position
+            known = buf0 + len(support)
+            prices = buffer[self.price]
+
+            # supports are final once `order` bars have followed them
+            new_sup_done = known if last else max(sup_done, known - order)
+            if new_sup_done > sup_done:
+                lo = max(sup_done - order, 0)
+                hi = min(new_sup_done + order, known)
+                sup_ix = argrelextrema(prices[lo - buf0:hi - buf0],
+                                       np.less_equal, order=order)[0] + lo
+                sup_ix = sup_ix[(sup_ix >= sup_done)
+                                & (sup_ix < new_sup_done)]
+                support[sup_ix - buf0] = prices[sup_ix - buf0]
+                pending.extend(zip(sup_ix, prices[sup_ix - buf0]))
+                sup_done = new_sup_done
+
+            # bars are final once the supports around them are
+            new_done = known if last else max(done, known - 2 * order)
+            if new_done == done:
+                return
+            lo, hi = done - buf0, new_done - buf0
+            line_lo = max(lo - order, 0)
+            line = _fill_limited(support[line_lo:hi + order], order)
+            line = _fill_limited(line, order, backward=True)
+
+            change, traded = np.zeros(hi - lo), np.zeros(hi - lo)
+            for i in range(done, new_done):
+                if i == 0:
+                    continue
+                if pending and i > pending[0][0]:
+                    book.add_support(pending.popleft()[1])
+                bought, sold = book.step(i, prices[i - buf0])
+                if bought is not None:
+                    change[i - done] += bought[5]
+                    traded[i - done] += bought[5]
+                if sold is not None:
+                    change[i - done] -= sold[5]
+                    traded[i - done] += sold[5]
+            positions = _cumsum(change, position)
+            position = positions[-1]
+
+            cols = {col: values[lo:hi] for col, values in buffer.items()}
+            cols["Support"] = support[lo:hi]
+            cols["Support Line"] = line[lo - line_lo:hi - line_lo]
+            cols["Position"] = positions
+            cols.update(_returns(cols[self.price], positions, self.init_cash,
+                                 self.cost, carry, traded))
+            for strategy, ret in RETURNS.items():
+                analytics = self.analytics[strategy].run(cols[ret],
+                                                         cols[strategy])
+                for col, values in analytics.items():
+                    cols[f"{strategy} {col}"] = values
+            if sink is not None:
+                sink(pd.DataFrame(cols, index=pd.RangeIndex(done, new_done)))
+            done = new_done
+
+            # keep the bars still needed to find and draw supports
+            keep = max(done - 2 * order, 0) - buf0
+            buffer = {col: values[keep:] for col, values in buffer.items()}
+            support = support[keep:]
+            buf0 += keep
+
+        for block in blocks:
+            block = to_columns(block)
+            if len(block[self.price]) == 0:
+                continue
+            if start is None:
+                start = block["Date"][0]
+                buffer = {col: values[:0] for col, values in block.items()}
+            end = block["Date"][-1]
+            buffer = {col: np.concatenate([buffer[col], values])
+                      for col, values in block.items()}
+            support = np.concatenate(
+                [support, np.full(len(block[self.price]), np.nan)])
+            advance(last=False)
+        if start is None:
+            raise ValueError("No bars to backtest.")
+        advance(last=True)
+
+        self.trades = book.ledger()
+        n = buf0 + len(support) - 1
+        return self._simulate(
+            start, end, n,
+            {strategy: carry[strategy] for strategy in RETURNS})
 
     # --------------------- Find Support Prices ---------------------
     # ASSUMPTIONS:
@@ -84,20 +427,43 @@ class BaseTrader:
     # - The longer the "period of support" gets, the stronger the supports are,
     #   the higher chance of price visiting the broken supports again.
 
-    def _find_support(self, X):
-        sup_ix = argrelextrema(X[self.price].values, np.less_equal,
-                               order=self.valid_days)
-        sup_prices = X.loc[sup_ix, self.price]
-        X['Support'] = sup_prices
+    def _find_support(self, X, pyramid=None):
+        sup_ix, sup_prices = self._supports(X, self.price, pyramid)
+
+        support = np.full(len(X["Date"]), np.nan)
+        support[sup_ix] = sup_prices
+        X['Support'] = support
 
-        self.sup_prices, self.sup_ix = [], []
         self.sup_prices = list(sup_prices[::-1])  # stored as stacks
-        self.sup_ix = list(sup_ix[0][::-1])  # stored as stacks
+        self.sup_ix = list(sup_ix[::-1])  # stored as stacks
+
+    def _supports(self, X, price, pyramid=None):
+        if self.timeframe is None:
+            prices = X[price]
+            sup_ix = argrelextrema(prices, np.less_equal,
+                                   order=self.valid_days)[0]
+            return sup_ix, prices[sup_ix]
+
+        # supports are found on the coarser bars, and start counting on
+        # the trading bar their coarse bar closes on
+        if pyramid is None:
+            pyramid = ResamplePyramid(
+                pd.DataFrame({"Date": X["Date"], price: X[price]}),
+                (self.timeframe,))
+        # only the bars of X's range, whatever else the pyramid holds
+        level = pyramid.window(self.timeframe, X["Date"][0], X["Date"][-1])
+        prices = level[price].values
+        level_sups = argrelextrema(prices, np.less_equal,
+                                   order=self.valid_days)[0]
+        level_ix, bar_ix = pyramid.to_bar_ix(self.timeframe, X["Date"],
+                                             level)
+        confirmed = np.isin(level_ix, level_sups)
+        return bar_ix[confirmed], prices[level_ix[confirmed]]
 
     def _make_support_line(self, X):
         line_len = self.valid_days
-        X["Support Line"] = X["Support"].fillna(method='ffill', limit=line_len)
-        X["Support Line"].fillna(method='bfill', limit=line_len, inplace=True)
+        line = _fill_limited(X["Support"], line_len)
+        X["Support Line"] = _fill_limited(line, line_len, backward=True)
 
     # --------------------- Buy & Sell Signals ---------------------
     # RULES:
@@ -109,75 +475,86 @@ class BaseTrader:
     #   maximum (set in the begining)
 
     def _make_signal(self, X):
-        today_sups, bought_sups = [], []  # store as stacks
-        X.loc[0, 'Position'] = 0
-        for i in range(1, len(X)):
-            if len(self.sup_ix) > 0 and i > self.sup_ix[-1]:
-                today_sups.append(self.sup_prices.pop())
-                self.sup_ix.pop()
-                today_sups.sort()
-                # sort so we start buying when largest supports are broken
-
-            # mimic yesterday's position in case there's no buys/sells today
-            X.loc[i, 'Position'] = X.loc[i - 1, 'Position']
-            today_price = X.loc[i, self.price]
-
-            if (len(today_sups) > 0
-                    and len(bought_sups) < self.max_pos
-                    and today_price < today_sups[-1] * self.dip_to_buy):
-                X.loc[i, 'Position'] += self.pos_size
-                X.loc[i, 'Bought Price'] = today_price
-                bought_sups.append(today_sups.pop())
-
-            if (len(bought_sups) > 0
-                    and today_price > bought_sups[0] * self.hype_to_sell):
-                X.loc[i, 'Position'] -= self.pos_size
-                X.loc[i, 'Sold Price'] = today_price
-                bought_sups = bought_sups[1:]
+        prices = X[self.price]
+        self.trades = self._trade(prices[:, np.newaxis],
+                                  [(self.sup_ix, self.sup_prices)])[0]
+        X["Position"] = _position(self.trades, len(prices))
+
+    def _trade(self, prices, stacks, books=None):
+        # one pass over the bars of every price column, each column with
+        # its own stacks of supports (popped as they become valid) and its
+        # own book (with this trader's parameters unless given)
+        n, k = prices.shape
+        if books is None:
+            books = [SignalBook(self) for _ in range(k)]
+        for i in range(1, n):
+            for j in range(k):
+                sup_ix, sup_prices = stacks[j]
+                if len(sup_ix) > 0 and i > sup_ix[-1]:
+                    books[j].add_support(sup_prices.pop())
+                    sup_ix.pop()
+                books[j].step(i, prices[i, j])
+        return [book.ledger() for book in books]
 
     # --------------------- Compute Cumulative Returns  ---------------------
     def _strat_return(self, X):
-        X['Market Log Return'] = np.log(X[self.price] / X[self.price].shift(1))
-        X['Strategy Log Return'] = X['Position'].shift(1) * X[
-            'Market Log Return']
-        X['Buy & Hold'] = (X['Market Log Return'].cumsum().apply(np.exp)
-                           * self.init_cash)
-        X['Base Trading'] = (X['Strategy Log Return'].cumsum().apply(np.exp)
-                             * self.init_cash)
-        X['Market Return'] = ((X['Buy & Hold'] - X['Buy & Hold'].shift(1))
-                              / X['Buy & Hold'])
-        X['Strategy Return'] = (
-                (X['Base Trading'] - X['Base Trading'].shift(1))
-                / X['Base Trading'])
-
-    def _simulate(self, X):
+        X.update(_returns(X[self.price], X['Position'], self.init_cash,
+                          self.cost,
+                          traded=_traded(self.trades, len(X['Position']))))
+
+    # --------------------- Rolling & Drawdown Analytics ---------------------
+    def _analytics(self, X):
+        self.analytics = {}
+        for strategy, ret in RETURNS.items():
+            analytics = StreamingAnalytics(self.window, self.periods)
+            columns = analytics.run(X[ret], X[strategy])
+            for col, values in columns.items():
+                X[f"{strategy} {col}"] = values
+            self.analytics[strategy] = analytics
+
+    def _column_performance(self, returns, j, strategy):
+        # numeric metrics of one strategy on column j of stacked returns
+        n = len(returns[strategy])
+        analytics = StreamingAnalytics(None, self.periods)
+        analytics.run(returns[RETURNS[strategy]][:, j],
+                      returns[strategy][:, j])
+        return self._performance(returns[strategy][n - 1, j], n - 1,
+                                 analytics)
+
+    def _performance(self, ending_cash, n, analytics):
+        # numeric metrics of one strategy over n days
+        profit = ending_cash - self.init_cash
+        annual_return = ((ending_cash / self.init_cash) ** (self.periods / n)
+                         - 1) * 100
+        annual_vol = analytics.total.std * np.sqrt(self.periods) * 100
+        sharpe = ((annual_return - 0.08) / annual_vol
+                  if annual_vol >= FLAT_VOLATILITY * 100 else np.nan)
+        drawdown = analytics.drawdown
+        return {
+            "Ending Cash": ending_cash,
+            "Total Profit": profit,
+            "Profit Margin (%)": profit / self.init_cash * 100,
+            "Annualized Return (%)": annual_return,
+            "Annualized Volatility (%)": annual_vol,
+            "Sharpe Ratio": sharpe,
+            "Max Drawdown (%)": drawdown.max_drawdown * 100,
+            "Max Drawdown Duration": drawdown.max_duration,
+            "Time Under Water (%)": drawdown.time_under_water * 100,
+        }
+
+    def _simulate(self, start, end, n, ending_cash):
         stats = pd.DataFrame(index=["Buy & Hold", "Base Trading"])
-        n = len(X) - 1
-        stats["Start"] = X.loc[0, "Date"]
-        stats["End"] = X.loc[n, "Date"]
+        stats["Start"] = pd.Timestamp(start)
+        stats["End"] = pd.Timestamp(end)
         stats["Duration"] = (stats["End"] - stats["Start"]).apply(
             lambda x: f"{x.days} days")
         stats["Initial Cash"] = self.init_cash
 
-        for strategy in ["Buy & Hold", "Base Trading"]:
-            stats.loc[strategy, "Ending Cash"] = X.loc[n, strategy]
-
-        stats["Total Profit"] = stats["Ending Cash"] - stats["Initial Cash"]
-        stats["Profit Margin (%)"] = (stats["Total Profit"] /
-                                      stats["Initial Cash"] * 100)
-        stats["Annualized Return (%)"] = ((stats["Ending Cash"] / 
-                                          stats["Initial Cash"]) ** 
-                                          (365 / n) - 1) * 100
-
-        stats.loc["Buy & Hold", "Annualized Volatility (%)"] = np.std(
-            X["Market Return"][2:])
-        stats.loc["Base Trading", "Annualized Volatility (%)"] = np.std(
-            X["Strategy Return"][2:])
-        stats["Annualized Volatility (%)"] = (stats[
-            "Annualized Volatility (%)"]) * np.sqrt(365) * 100
-
-        stats["Sharpe Ratio"] = ((stats["Annualized Return (%)"] - 0.08) /
-                                 stats["Annualized Volatility (%)"])
+        performance = pd.DataFrame.from_dict(
+            {strategy: self._performance(ending_cash[strategy], n, analytics)
+             for strategy, analytics in self.analytics.items()},
+            orient="index")
+        stats = stats.join(performance)
 
         for col in ["Initial Cash", "Ending Cash", "Total Profit"]:
             stats[col] = stats[col].apply(lambda x: f"${int(x):,}")
@@ -185,12 +562,209 @@ class BaseTrader:
         stats["Profit Margin (%)"] = stats["Profit Margin (%)"].apply(
             lambda x: f"{int(x):,}% ({round(x / 100, 2)}x)")
 
-        for col in ["Annualized Return (%)", "Annualized Volatility (%)"]:
+        for col in ["Annualized Return (%)", "Annualized Volatility (%)",
+                    "Max Drawdown (%)", "Time Under Water (%)"]:
             stats[col] = stats[col].apply(lambda x: f"{round(x, 2)}%")
 
         stats["Sharpe Ratio"] = stats["Sharpe Ratio"].apply(
             lambda x: round(x, 2))
+        stats["Max Drawdown Duration"] = stats["Max Drawdown Duration"].apply(
+            lambda x: f"{x} days")
 
         stats = stats.T.reset_index()
         stats.rename(columns={"index": "Metrics"}, inplace=True)
         return stats
+
+
+class SignalBook:
+    """
+    Buy & sell state of the strategy on one price series: supports that
+    are valid but not bought yet, and lots still open.
+
+    Methods
+    ----------
+    add_support(level)
+        Make a support available for buying
+
+    step(i, price)
+        Buy and/or sell on bar `i` at `price`
+
+    ledger()
+        Trade ledger of every lot bought so far
+    """
+
+    def __init__(self, trader):
+        """
+        Parameters
+        ----------
+        trader : BaseTrader
+            Provides the strategy's parameters
+        """
+        self.max_pos = trader.max_pos
+        self.pos_size = trader.pos_size
+        self.dip_to_buy = trader.dip_to_buy
+        self.hype_to_sell = trader.hype_to_sell
+        self.today_sups = []  # store as stacks
+        self.bought_lots = deque()  # open lots, oldest first (FIFO)
+        self.lots = []
+
+    def add_support(self, level):
+        self.today_sups.append(level)
+        self.today_sups.sort()
+        # sort so we start buying when largest supports are broken
+
+    def step(self, i, price):
+        """
+        Returns
+        -------
+        bought, sold : list or None
+            Lots bought and sold on this bar, if any
+        """
+        bought, sold = None, None
+        if (len(self.today_sups) > 0
+                and len(self.bought_lots) < self.max_pos
+                and price < self.today_sups[-1] * self.dip_to_buy):
+            bought = [i, -1, self.today_sups.pop(), price, np.nan,
+                      self.pos_size]
+            self.bought_lots.append(bought)
+            self.lots.append(bought)
+
+        if (len(self.bought_lots) > 0
+                and price > self.bought_lots[0][2] * self.hype_to_sell):
+            sold = self.bought_lots.popleft()
+            sold[1], sold[4] = i, price
+        return bought, sold
+
+    def ledger(self):
+        return np.array([tuple(lot) for lot in self.lots], dtype=TRADE_DTYPE)
+
+
+# --------------------- Array Helpers ---------------------
+def _position(trades, n):
+    # positions only change on trade dates, so rebuild them from the
+    # ledger instead of carrying them bar by bar
+    change = np.zeros(n)
+    closed = trades[trades["exit_ix"] >= 0]
+    np.add.at(change, trades["entry_ix"], trades["size"])
+    np.subtract.at(change, closed["exit_ix"], closed["size"])
+    return np.cumsum(change)
+
+
+def _traded(trades, n):
+    # size bought plus size sold on every bar, so that a lot bought and
+    # another one sold on the same bar both pay costs
+    traded = np.zeros(n)
+    closed = trades[trades["exit_ix"] >= 0]
+    np.add.at(traded, trades["entry_ix"], trades["size"])
+    np.add.at(traded, closed["exit_ix"], closed["size"])
+    return traded
+
+
+def _returns(prices, position, init_cash, cost=0.0, carry=None, traded=None):
+    # returns and equity curves of both strategies, all derived from the
+    # log returns. Works on a single price column or on stacked
+    # (bars x columns) arrays. `cost` is the fraction of the traded value
+    # lost to fees and slippage on every buy/sell, and `traded` the size
+    # bought and sold on every bar (from the ledger, see _traded), the
+    # change of position if None. `carry` holds the last values of the
+    # previous block of bars, if any, and is updated for the next one
+    carry = {} if carry is None else carry
+    prev_position = _shift(position, carry.get('position', np.nan))
+    market_log = np.log(prices / _shift(prices, carry.get('price', np.nan)))
+    strategy_log = prev_position * market_log
+    if cost:
+        if traded is None:
+            traded = np.nan_to_num(np.abs(position - prev_position))
+        strategy_log = strategy_log + np.log1p(-traded * cost)
+
+    returns = {'Market Log Return': market_log,
+               'Strategy Log Return': strategy_log}
+    simple_returns = {}
+    for strategy, ret in RETURNS.items():
+        log_return = returns[ret.replace("Return", "Log Return")]
+        total = _cumsum(log_return, carry.get(f'{strategy} sum', 0.0))
+        returns[strategy] = np.exp(np.where(np.isnan(log_return), np.nan,
+                                            total)) * init_cash
+        # (E_t - E_t-1) / E_t, defined once both equities are
+        simple = -np.expm1(-log_return)
+        simple[np.isnan(_shift(log_return,
+                               carry.get(f'{strategy} log', np.nan)))] = np.nan
+        simple_returns[ret] = simple
+
+        carry[f'{strategy} sum'] = total[-1]
+        carry[f'{strategy} log'] = log_return[-1]
+        carry[strategy] = returns[strategy][-1]
+    returns.update(simple_returns)
+    carry['price'], carry['position'] = prices[-1], position[-1]
+    return returns
+
+
+def _shift(values, first=np.nan):
+    shifted = np.empty(np.shape(values))
+    shifted[0] = first
+    shifted[1:] = values[:-1]
+    return shifted
+
+
+def _cumsum(values, start=0.0):
+    # running sum skipping NaNs (like pandas), starting from `start`
+    start = np.broadcast_to(start, (1,) + np.shape(values)[1:])
+    return np.nancumsum(np.concatenate([start, values]), axis=0)[1:]
+
+
+def _fill_limited(values, limit, backward=False):
+    # fill NaNs with the last (next if backward) valid value, at most
+    # `limit` bars away, like pandas' ffill/bfill with a limit
+    if backward:
+        return _fill_limited(values[::-1], limit)[::-1]
+    n = len(values)
+    valid = ~np.isnan(values)
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(n), -1))
+    fill = (~valid) & (last_valid >= 0) & (np.arange(n) - last_valid <= limit)
+    filled = values.copy()
+    filled[fill] = values[last_valid[fill]]
+    return filled
+
+
+def summarize_trades(trades, last_ix=None, last_price=None):
+    """
+    Per-trade performance computed from a trade ledger.
+
+    Parameters
+    ----------
+    trades : ndarray
+        Trade ledger of `TRADE_DTYPE`, e.g. `BaseTrader.trades`
+    last_ix : int, default=None
+        Index of the last bar, used to mark open lots to market
+    last_price : float, default=None
+        Price of the last bar, used to mark open lots to market. Open lots
+        are left out if None.
+
+    Returns
+    -------
+    DataFrame
+        One row per trade with its return, P&L as a fraction of the
+        portfolio and holding time (in bars)
+    """
+    trades = pd.DataFrame(trades)
+    is_open = trades["exit_ix"] < 0
+    if last_price is None:
+        trades = trades[~is_open]
+    else:
+        trades.loc[is_open, "exit_ix"] = last_ix
+        trades.loc[is_open, "exit_price"] = last_price
+    trades["Open"] = is_open
+    trades["Return"] = trades["exit_price"] / trades["entry_price"] - 1
+    trades["P&L"] = trades["Return"] * trades["size"]
+    trades["Holding"] = trades["exit_ix"] - trades["entry_ix"]
+    return trades
+
+
+def win_rate(trades):
+    """
+    Share of closed trades in a ledger that made a profit.
+    """
+    closed = trades[trades["exit_ix"] >= 0]
+    if len(closed) == 0:
+        return np.nan
+    return np.mean(closed["exit_price"] > closed["entry_price"])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Columnar Inputs
+
+The script lets the backtester read historical prices from any columnar
+container (pandas DataFrame with any index, dict of NumPy arrays, Arrow
+table) as NumPy views of the underlying buffers, and hand results back in
+the caller's format.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow inputs are optional
+    pa = None
+
+
+def to_columns(X):
+    """
+    Views of the columns of a columnar container as NumPy arrays.
+
+    Columns are not copied unless the container requires it (e.g. an Arrow
+    column split in several chunks, or holding nulls).
+
+    Parameters
+    ----------
+    X : DataFrame, dict of array-like or pyarrow.Table
+        Contains the asset's historical prices. A DataFrame without a
+        `Date` column uses its index as dates.
+
+    Returns
+    -------
+    dict
+        NumPy array of every column
+    """
+    if isinstance(X, pd.DataFrame):
+        columns = {col: X[col].to_numpy() for col in X.columns}
+        if "Date" not in columns and isinstance(X.index, pd.DatetimeIndex):
+            columns["Date"] = X.index.to_numpy()
+    elif isinstance(X, dict):
+        columns = {col: np.asarray(values) for col, values in X.items()}
+    elif pa is not None and isinstance(X, pa.Table):
+        columns = {name: X.column(name).to_numpy()
+                   for name in X.column_names}
+    else:
+        raise TypeError(f"Unsupported input type: {type(X).__name__}")
+
+    if "Date" in columns:
+        columns["Date"] = columns["Date"].astype("datetime64[ns]",
+                                                 copy=False)
+    return columns
+
+
+def from_columns(X, new_columns):
+    """
+    Add computed columns to the caller's container.
+
+    Parameters
+    ----------
+    X : DataFrame, dict of array-like or pyarrow.Table
+        Container passed to `to_columns`
+    new_columns : dict
+        NumPy array of every column to add, as long as `X`
+
+    Returns
+    -------
+    DataFrame, dict or pyarrow.Table
+        Same type as `X`, with its columns followed by the new ones. The
+        input columns are shared, except for DataFrames which are copied
+        like before.
+    """
+    if isinstance(X, pd.DataFrame):
+        X_copy = X.copy()
+        for col, values in new_columns.items():
+            X_copy[col] = values
+        return X_copy
+    if isinstance(X, dict):
+        return {**X, **new_columns}
+    for col, values in new_columns.items():
+        X = X.append_column(col, pa.array(values))
+    return X
@@ -5,11 +5,65 @@ Data Collector
 The script allows fetching historical prices of assets available on Yahoo!
 Finance and storing the data in csv files.
 """
+import contextlib
+import json
 import os
+import threading
+import uuid
 
 import pandas as pd
 import pandas_datareader.data as web  # Reads stock data from Yahoo!
 
+try:
+    import fcntl
+except ImportError:  # no cross-process locking on Windows
+    fcntl = None
+
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+
+def write_atomic(path, text):
+    """
+    Write a text file through a temporary file renamed over `path` once
+    complete, so readers never see a partially written file. The temporary
+    file is removed if the write fails.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Hold the lock of a file, both between the threads of this process and
+    (where fcntl is available) between processes, e.g. gunicorn workers.
+
+    Yields
+    ------
+    file
+        The lock file "<path>.lock", opened for reading and writing, which
+        can hold small notes shared by the lock holders
+    """
+    with _file_locks_lock:
+        lock = _file_locks.setdefault(os.path.abspath(path),
+                                      threading.Lock())
+    with lock, open(f"{path}.lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield lock_file
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
 class Collector:
     """
@@ -77,7 +131,31 @@ class Collector:
             raise NoTickerError(
                 f"{self.ticker} not available on Yahoo! Finance.")
         data.reset_index(inplace=True)
-        data.to_csv(self.data_path)
+        write_atomic(self.data_path, data.to_csv())
+        return data
+
+    def _read_cache(self, fetched=None):
+        """
+        Historical prices from the csv file, None if the file does not hold
+        the dates required.
+
+        `fetched` is the (start, end) range the file was last fetched for,
+        if known: the file holds everything the source has in that range,
+        even if its first/last dates are not the bounds (e.g. holidays).
+        """
+        if not os.path.exists(self.data_path):
+            return None
+        data = pd.read_csv(self.data_path, index_col=0)
+        data['Date'] = pd.to_datetime(data['Date'])
+        first_date, end_date = data.iloc[0, 0], data.iloc[-1, 0]
+        covered = first_date <= self.start and end_date >= self.end
+        if fetched is not None:
+            covered |= fetched[0] <= self.start and fetched[1] >= self.end
+        if not covered:
+            return None
+        mask = (self.start < data['Date']) & (data['Date'] < self.end)
+        data = data[mask]
+        data.reset_index(drop=True, inplace=True)
         return data
 
     def get_historical(self):
@@ -85,29 +163,56 @@ class Collector:
         Wrapper of fetch() to handle cases where data of the
         target asset has already been fetched before
 
+        Concurrent requests for a ticker that needs to be fetched wait for a
+        single fetch and share its result.
+
         Returns
         -------
             A DataFrame of historical prices fetched from Yahoo! Finance
         """
-        if os.path.exists(self.data_path):
-            data = pd.read_csv(self.data_path, index_col=0)
-            data['Date'] = pd.to_datetime(data['Date'])
-            first_date, end_date = data.iloc[0, 0], data.iloc[-1, 0]
-
-            # Fetch new data if we do not have the dates required on our
-            # cache yet
-            if first_date > self.start or end_date < self.end:
-                data = self.fetch()
-            # Or simply filter to avoid calling the API again
-            else:
-                mask = (self.start < data['Date']) & (data['Date'] < self.end)
-                data = data[mask]
-                data.reset_index(drop=True, inplace=True)
-        else:
-            data = self.fetch()
+        data = self._read_cache()
+        if data is None:
+            with file_lock(self.data_path) as lock_file:
+                # the range of the last fetch is kept in the lock file, so
+                # requesters who waited for it use its result
+                lock_file.seek(0)
+                note = lock_file.read()
+                fetched = (tuple(pd.to_datetime(json.loads(note)))
+                           if note else None)
+                data = self._read_cache(fetched)
+                if data is None:
+                    self.fetch()
+                    lock_file.truncate(0)
+                    lock_file.write(json.dumps(
+                        [self.start.isoformat(), self.end.isoformat()]))
+                    lock_file.flush()
+                    # read back like the waiters, so all get the same bars
+                    data = self._read_cache((self.start, self.end))
         return data
 
 
+def read_blocks(data_path, block_size=100000):
+    """
+    Stream historical prices stored by Collector from disk, block by block,
+    without loading the whole file.
+
+    Parameters
+    ----------
+    data_path : str
+        Path of the .csv file
+    block_size : int, default=100000
+        Number of bars per block
+
+    Yields
+    ------
+    DataFrame
+        Consecutive blocks of historical prices, indexed by bar number
+    """
+    for block in pd.read_csv(data_path, index_col=0, chunksize=block_size,
+                             parse_dates=["Date"]):
+        yield block
+
+
 class NoTickerError(Exception):
     """
     Raised when the ticker is not available on Yahoo! Finance
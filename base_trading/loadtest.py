@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Dashboard Load Test
+
+The script starts the dashboard with gunicorn against synthetic historical
+prices (no Yahoo! Finance access needed), replays a mix of form submissions
+(every callback the browser fires for them) with varied tickers and
+parameters at a given concurrency, and reports throughput, latency
+percentiles, memory use and cache hit rates of every worker, so that
+changes to the serving path can be compared on the same machine.
+
+Usage:
+    python -m base_trading.loadtest --workers 2 --concurrency 8 \
+        --submissions 200
+
+or, to test an app started separately with DATA_DIR=loadtest-data:
+    python -m base_trading.loadtest --data-dir loadtest-data \
+        --url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Form of the dashboard, in the order of the States of `update_preview` and
+# `update_strat`, and the fields used by `update_sensitivity`
+FORM = ("ticker", "data-source", "start-date", "end-date", "marked-price",
+        "init-cash", "max-pos", "valid-days", "support-timeframe",
+        "break-support", "break-resist", "fee", "slippage", "graph-scale")
+SENSITIVITY_FORM = FORM[:9] + ("fee", "slippage")
+
+# Outputs of the callbacks fired by a submission: the preview and the
+# sensitivity heatmap at once, then the exact results once the preview is
+# done
+PREVIEW = (("price-preview", "children"), ("strat-preview", "children"),
+           ("stats-preview", "children"), ("preview-token", "data"))
+STRAT = (("price-graph", "children"), ("strat-graph", "children"),
+         ("stats-table", "children"), ("full-token", "data"))
+SENSITIVITY = (("sensitivity-graph", "figure"),)
+CALLBACKS = ("update_preview", "update_strat", "update_sensitivity")
+
+# Values picked by the simulated users, the first one being the default
+CHOICES = {
+    "marked-price": ["Close", "Open", "Low"],
+    "init-cash": [10000, 1000, 100000],
+    "max-pos": [5, 3, 10],
+    "valid-days": [20, 10, 30],
+    "support-timeframe": ["D", "W"],
+    "break-support": [10, 5, 15, 20],
+    "break-resist": [40, 20, 60],
+    "fee": [0, 0.1],
+    "slippage": [0, 0.05],
+    "graph-scale": ["log", "linear"],
+}
+
+
+def make_prices(n_bars, seed, start="2010-01-01"):
+    """
+    Synthetic daily prices (geometric random walk) in the format of the
+    files cached by data.Collector.
+
+    Returns
+    -------
+    DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.03, n_bars)))
+    open_ = close * np.exp(rng.normal(0, 0.01, n_bars))
+    wick = np.exp(abs(rng.normal(0, 0.01, (2, n_bars))))
+    high = np.maximum(open_, close) * wick[0]
+    low = np.minimum(open_, close) / wick[1]
+    return pd.DataFrame({
+        "Date": pd.date_range(start, periods=n_bars, freq="D"),
+        "High": high,
+        "Low": low,
+        "Open": open_,
+        "Close": close,
+        "Volume": rng.integers(10 ** 6, 10 ** 8, n_bars),
+        "Adj Close": close,
+    })
+
+
+def write_data(data_dir, tickers, n_bars):
+    """
+    Write synthetic prices of every ticker to `data_dir`.
+
+    Returns
+    -------
+    first : Timestamp
+        First date of the prices
+    last : Timestamp
+        Last date of the prices
+    """
+    for k, ticker in enumerate(tickers):
+        data = make_prices(n_bars, seed=k)
+        data.to_csv(os.path.join(data_dir, f"{ticker}.csv"))
+    return data["Date"].iloc[0], data["Date"].iloc[-1]
+
+
+def _pick(rng, values):
+    # Zipf-like popularity: the k-th value is 1/(k+1) as likely as the first
+    return rng.choices(values, weights=[1 / (k + 1)
+                                        for k in range(len(values))])[0]
+
+
+def make_submissions(n, tickers, first, last, seed=0):
+    """
+    Settings of `n` simulated form submissions between the `first` and
+    `last` dates of the prices. Popular tickers are requested more often,
+    and users keep the default parameters except for up to two of them (so
+    caches get some hits).
+
+    Returns
+    -------
+    list of dict
+        Value of every field of `FORM`
+    """
+    rng = random.Random(seed)
+    # the whole history, its last 60% or its last 30%
+    starts = [(first + (last - first) * f).date().isoformat()
+              for f in [0.01, 0.4, 0.7]]
+    end = (last - pd.Timedelta(days=1)).date().isoformat()
+    submissions = []
+    for _ in range(n):
+        form = {field: values[0] for field, values in CHOICES.items()}
+        for field in rng.sample(list(CHOICES), rng.randint(0, 2)):
+            form[field] = rng.choice(CHOICES[field][1:])
+        form.update({"ticker": _pick(rng, tickers), "data-source": "yahoo",
+                     "start-date": _pick(rng, starts), "end-date": end})
+        submissions.append(form)
+    return submissions
+
+
+def _payload(outputs, inputs, form, fields):
+    if len(outputs) == 1:
+        output = "{}.{}".format(*outputs[0])
+        outputs_spec = {"id": outputs[0][0], "property": outputs[0][1]}
+    else:
+        output = "".join(f"..{id_}.{prop}." for id_, prop in outputs) + "."
+        outputs_spec = [{"id": id_, "property": prop}
+                        for id_, prop in outputs]
+    return {
+        "output": output,
+        "outputs": outputs_spec,
+        "inputs": [{"id": id_, "property": prop, "value": value}
+                   for id_, prop, value in inputs],
+        "changedPropIds": [f"{inputs[0][0]}.{inputs[0][1]}"],
+        "state": [{"id": field, "property": "value", "value": form[field]}
+                  for field in fields],
+    }
+
+
+def _post(url, payload, timeout):
+    # latency and response of one callback, None if it failed
+    request = urllib.request.Request(
+        f"{url}/_dash-update-component", data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = (json.loads(response.read())
+                    if response.status == 200 else None)
+    except (OSError, ValueError):
+        body = None
+    return time.perf_counter() - started, body
+
+
+def submit(url, form, n_clicks=1, timeout=300):
+    """
+    Send the callbacks of one submission to the dashboard like the browser
+    does: `update_preview` and `update_sensitivity` at once, then
+    `update_strat` with the token returned by the preview.
+
+    Returns
+    -------
+    seconds : float
+        Time until the last callback returned
+    callbacks : dict
+        Latency of every callback, None for those that failed
+    """
+    clicks = ("submit-button", "n_clicks", n_clicks)
+    latencies = {}
+
+    def sensitivity():
+        seconds, body = _post(url, _payload(
+            SENSITIVITY, [clicks, ("sensitivity-metric", "value",
+                                   "Sharpe Ratio")],
+            form, SENSITIVITY_FORM), timeout)
+        latencies["update_sensitivity"] = seconds if body else None
+
+    started = time.perf_counter()
+    thread = threading.Thread(target=sensitivity)
+    thread.start()
+    seconds, body = _post(url, _payload(PREVIEW, [clicks], form, FORM),
+                          timeout)
+    latencies["update_preview"] = seconds if body else None
+    latencies["update_strat"] = None
+    if body:
+        token = body["response"]["preview-token"]["data"]
+        seconds, body = _post(url, _payload(
+            STRAT, [("preview-token", "data", token)], form, FORM), timeout)
+        latencies["update_strat"] = seconds if body else None
+    thread.join()
+    return time.perf_counter() - started, latencies
+
+
+def worker_stats(url, n_workers, tries_per_worker=20):
+    """
+    Cache and memory statistics of every worker, sampled from /api/stats
+    until every worker answered (or enough tries were made).
+
+    Returns
+    -------
+    dict
+        Statistics of every worker, by process id
+    """
+    stats = {}
+    for _ in range(n_workers * tries_per_worker):
+        with urllib.request.urlopen(f"{url}/api/stats") as response:
+            worker = json.load(response)
+        stats[worker["pid"]] = worker
+        if len(stats) >= n_workers:
+            break
+    return stats
+
+
+def start_server(app_dir, data_dir, workers, threads, log_path):
+    """
+    Start the dashboard with gunicorn on a free local port.
+
+    Returns
+    -------
+    process : Popen
+    url : str
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = {**os.environ, "DATA_DIR": data_dir, "PREWARM_TOP": "0",
+           "POPULARITY_PATH": os.path.join(data_dir, "popularity.json")}
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            # the gunicorn script, run with this interpreter
+            [sys.executable, "-c",
+             "from gunicorn.app.wsgiapp import run; run()", "app:server",
+             "--workers", str(workers), "--threads", str(threads),
+             "--bind", f"127.0.0.1:{port}", "--timeout", "300"],
+            cwd=app_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 120
+    while time.time() < deadline and process.poll() is None:
+        try:
+            urllib.request.urlopen(f"{url}/api/stats", timeout=5).read()
+            return process, url
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    with open(log_path) as log:
+        raise RuntimeError(f"gunicorn did not start:\n{log.read()[-2000:]}")
+
+
+def _percentiles(latencies):
+    latencies = np.array(latencies)
+    if len(latencies) == 0:
+        return {name: None for name in ["p50", "p90", "p99", "max"]}
+    report = {f"p{q}": float(np.percentile(latencies, q))
+              for q in [50, 90, 99]}
+    report["max"] = float(latencies.max())
+    return report
+
+
+def run(url, submissions, concurrency):
+    """
+    Replay submissions with `concurrency` simulated users.
+
+    Returns
+    -------
+    dict
+        Throughput (submissions per second), latency percentiles (seconds)
+        of whole submissions and of every callback, and number of failed
+        submissions
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda k: submit(url, submissions[k], n_clicks=k + 1),
+            range(len(submissions))))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [seconds for seconds, callbacks in results
+                 if None not in callbacks.values()]
+    report = {
+        "submissions": len(results),
+        "errors": len(results) - len(succeeded),
+        "seconds": elapsed,
+        "throughput": len(succeeded) / elapsed,
+        **_percentiles(succeeded),
+        "callbacks": {
+            name: _percentiles([callbacks[name] for _, callbacks in results
+                                if callbacks[name] is not None])
+            for name in CALLBACKS},
+    }
+    return report
+
+
+def _format_latency(percentiles):
+    return ", ".join(f"{name} {percentiles[name] * 1000:.0f}ms"
+                     for name in ["p50", "p90", "p99", "max"]
+                     if percentiles[name] is not None)
+
+
+def print_report(report, workers):
+    print(f"Submissions: {report['submissions']} ({report['errors']} "
+          f"failed) in {report['seconds']:.1f}s")
+    print(f"Throughput:  {report['throughput']:.2f} submissions/s")
+    print(f"Latency:     {_format_latency(report)}")
+    for name, percentiles in report["callbacks"].items():
+        print(f"  {name}: {_format_latency(percentiles)}")
+    for pid, worker in sorted(workers.items()):
+        rates = []
+        for name, cache in worker["caches"].items():
+            calls = cache["hits"] + cache["misses"]
+            rate = f"{cache['hits'] / calls:.0%}" if calls else "-"
+            rates.append(f"{name} {rate} of {calls}")
+        rss = worker["max_rss_kb"]
+        memory = f"{rss / 1024:.0f}MB" if rss is not None else "n/a"
+        print(f"Worker {pid}: max RSS {memory}, cache hits: "
+              + ", ".join(rates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="Test a running app instead of "
+                                      "starting one")
+    parser.add_argument("--data-dir", help="Where to write the synthetic "
+                                           "prices, a temporary directory "
+                                           "if not set")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Simulated users submitting at once")
+    parser.add_argument("--submissions", type=int, default=100)
+    parser.add_argument("--tickers", type=int, default=5,
+                        help="Number of synthetic tickers")
+    parser.add_argument("--bars", type=int, default=3000,
+                        help="Daily bars of every synthetic ticker")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    tickers = [f"SYN-{k}" for k in range(args.tickers)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        first, last = write_data(data_dir, tickers, args.bars)
+        submissions = make_submissions(args.submissions, tickers, first, last,
+                                       args.seed)
+
+        process = None
+        if args.url:
+            url = args.url.rstrip("/")
+        else:
+            app_dir = os.path.dirname(
+                os.path.dirname(os.path.abspath(__file__)))
+            process, url = start_server(
+                app_dir, data_dir, args.workers, args.threads,
+                os.path.join(tmp_dir, "gunicorn.log"))
+        try:
+            report = run(url, submissions, args.concurrency)
+            workers = worker_stats(url, args.workers)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    print_report(report, workers)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({**report, "workers": workers}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
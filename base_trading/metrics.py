@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Streaming Performance Metrics
+
+The script provides single-pass accumulators (Welford's algorithm, running
+maximum) for volatility, Sharpe ratio and drawdown statistics. The same
+accumulators are used whether a whole series is processed at once or bars
+arrive one at a time, so batch and incremental results are identical.
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+# Annualized volatility below which returns are considered flat. Rounding
+# left in the variance once a window is flat is up to ~1e-7 for daily
+# returns, real volatilities are orders of magnitude above
+FLAT_VOLATILITY = 1e-6
+
+
+class RunningMoments:
+    """
+    Welford accumulator of the mean and (population) variance of a series,
+    either over everything seen so far or over a sliding window.
+
+    NaN values are ignored.
+
+    Attributes
+    ----------
+    count : int
+        Number of observations currently in the accumulator
+    mean : float
+        Mean of the observations currently in the accumulator
+    """
+
+    def __init__(self, window=None):
+        """
+        Parameters
+        ----------
+        window : int, default=None
+            Number of latest observations to keep. Everything seen so far is
+            kept if None.
+        """
+        self.window = window
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._values = deque() if window else None
+
+    def update(self, x):
+        """
+        Add an observation, dropping the oldest one if the window is full.
+        """
+        if math.isnan(x):
+            return
+        if self._values is not None:
+            if len(self._values) == self.window:
+                self._remove(self._values.popleft())
+            self._values.append(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+
+    def _remove(self, x):
+        self.count -= 1
+        if self.count == 0:
+            self.mean, self._m2 = 0.0, 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self._m2 = max(self._m2 - delta * (x - self.mean), 0.0)
+
+    @property
+    def var(self):
+        return self._m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.var) if self.count else np.nan
+
+
+class DrawdownTracker:
+    """
+    Running maximum of an equity curve with the drawdown statistics derived
+    from it.
+
+    NaN values are ignored.
+
+    Attributes
+    ----------
+    peak : float
+        Highest equity seen so far
+    drawdown : float
+        Current drawdown from the peak, as a fraction (<= 0)
+    max_drawdown : float
+        Deepest drawdown seen so far, as a fraction (<= 0)
+    duration : int
+        Number of bars since the last peak
+    max_duration : int
+        Longest number of bars spent below a peak
+    """
+
+    def __init__(self):
+        self.peak = -np.inf
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.duration = 0
+        self.max_duration = 0
+        self.count = 0
+        self.under_water = 0
+
+    def update(self, equity):
+        """
+        Add the latest equity value.
+        """
+        if math.isnan(equity):
+            return
+        self.count += 1
+        if equity >= self.peak:
+            self.peak = equity
+            self.duration = 0
+        else:
+            self.duration += 1
+            self.under_water += 1
+        self.drawdown = equity / self.peak - 1
+        self.max_drawdown = min(self.max_drawdown, self.drawdown)
+        self.max_duration = max(self.max_duration, self.duration)
+
+    @property
+    def time_under_water(self):
+        """
+        Fraction of bars spent below the running peak.
+        """
+        return self.under_water / self.count if self.count else np.nan
+
+
+class StreamingAnalytics:
+    """
+    Rolling volatility, rolling Sharpe ratio and drawdown statistics of a
+    strategy, updated one bar at a time.
+
+    Methods
+    ----------
+    update(ret, equity)
+        Add one bar and return its rolling/drawdown values
+
+    run(returns, equity)
+        Process whole series at once, bar by bar
+    """
+
+    COLUMNS = ["Rolling Volatility", "Rolling Sharpe", "Drawdown",
+               "Max Drawdown", "Drawdown Duration"]
+
+    def __init__(self, window=30, periods=365):
+        """
+        Parameters
+        ----------
+        window : int, default=30
+            Number of bars in the rolling window. Rolling values are
+            skipped (left NaN) if None, when only whole-period statistics
+            are needed.
+        periods : int, default=365
+            Number of bars per year, used to annualize
+        """
+        self.window = window
+        self.periods = periods
+        self.rolling = RunningMoments(window) if window else None
+        self.total = RunningMoments()
+        self.drawdown = DrawdownTracker()
+
+    def update(self, ret, equity):
+        """
+        Parameters
+        ----------
+        ret : float
+            Return of the bar
+        equity : float
+            Equity at the end of the bar
+
+        Returns
+        -------
+        tuple
+            Values of the bar, in the order of `COLUMNS`
+        """
+        self.total.update(ret)
+        self.drawdown.update(equity)
+        if self.rolling is not None:
+            self.rolling.update(ret)
+
+        if self.rolling is None or self.rolling.count < self.window:
+            vol, sharpe = np.nan, np.nan
+        else:
+            vol = self.rolling.std * math.sqrt(self.periods)
+            if vol < FLAT_VOLATILITY:
+                # rounding left by values leaving a window of flat returns
+                vol, sharpe = 0.0, np.nan
+            else:
+                sharpe = self.rolling.mean * self.periods / vol
+        return (vol, sharpe, self.drawdown.drawdown,
+                self.drawdown.max_drawdown, self.drawdown.duration)
+
+    def run(self, returns, equity):
+        """
+        Parameters
+        ----------
+        returns : array-like
+            Returns of every bar
+        equity : array-like
+            Equity at the end of every bar
+
+        Returns
+        -------
+        dict
+            One array per name in `COLUMNS`
+        """
+        out = np.empty((len(returns), len(self.COLUMNS)))
+        for i, (ret, eq) in enumerate(zip(returns, equity)):
+            out[i] = self.update(ret, eq)
+        return {col: out[:, j] for j, col in enumerate(self.COLUMNS)}
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Request Popularity
+
+The script counts how often each set of backtest parameters is requested,
+and persists the counts to a JSON file so that the most popular requests
+can be computed ahead of time (e.g. when the dashboard starts).
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from base_trading.data import file_lock, write_atomic
+
+
+class PopularityTracker:
+    """
+    A class used to rank requests by how often they were made.
+
+    Requests are dicts of JSON-serializable values. Counts are written to
+    disk at most every `save_seconds`, atomically. Several processes (e.g.
+    gunicorn workers) can share the file: each one adds the requests it
+    counted since its last write to the counts on disk, under a file lock.
+    Only the `keep` most requested requests are written, so the file stays
+    small however varied the requests are.
+
+    Methods
+    ----------
+    record(request)
+        Count one more occurrence of a request
+
+    top(n)
+        Most requested requests
+
+    save()
+        Add the new counts to the file
+    """
+
+    def __init__(self, path, save_seconds=30, keep=1000):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the JSON file holding the counts, read if it exists
+        save_seconds : int, default=30
+            Minimum number of seconds between two writes of the file
+        keep : int, default=1000
+            Number of most requested requests kept in the file, the others
+            are forgotten
+        """
+        self.path = path
+        self.save_seconds = save_seconds
+        self.keep = keep
+        self.counts = self._read()
+        self._unsaved = Counter()  # counted since the last write
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._last_save = time.monotonic()
+
+    @staticmethod
+    def _key(request):
+        return json.dumps(request, sort_keys=True, default=str)
+
+    def _read(self):
+        counts = Counter()
+        try:
+            with open(self.path) as f:
+                for entry in json.load(f):
+                    counts[self._key(entry["request"])] = entry["count"]
+        except FileNotFoundError:
+            pass
+        except ValueError:  # unreadable file, start counting again
+            pass
+        return counts
+
+    def record(self, request):
+        """
+        Parameters
+        ----------
+        request : dict
+            Parameters of the request
+        """
+        key = self._key(request)
+        with self._lock:
+            self.counts[key] += 1
+            self._unsaved[key] += 1
+            due = time.monotonic() - self._last_save >= self.save_seconds
+        if due:
+            self.save()
+
+    def top(self, n=10):
+        """
+        Returns
+        -------
+        list of dict
+            The `n` most requested requests, most requested first
+        """
+        with self._lock:
+            return [json.loads(key) for key, _ in self.counts.most_common(n)]
+
+    def save(self):
+        """
+        Add the requests counted since the last write to the file, keeping
+        the `keep` most requested ones, and refresh the counts with those
+        of the other processes.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._unsaved:
+                    return
+                unsaved, self._unsaved = self._unsaved, Counter()
+                self._last_save = time.monotonic()
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            try:
+                with file_lock(self.path):
+                    counts = self._read()
+                    counts.update(unsaved)
+                    counts = Counter(dict(counts.most_common(self.keep)))
+                    entries = [{"request": json.loads(key), "count": count}
+                               for key, count in counts.most_common()]
+                    write_atomic(self.path, json.dumps(entries, indent=1))
+            except BaseException:
+                with self._lock:  # written next time
+                    self._unsaved.update(unsaved)
+                raise
+
+            with self._lock:
+                counts.update(self._unsaved)
+                self.counts = counts
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Resample Pyramid
+
+The script keeps coarser timeframes (e.g. daily -> weekly -> monthly, or
+minute -> hour -> day) of an asset's historical prices, so that supports can
+be found on a different timeframe than the one used for trading. Pyramids
+are cached per ticker, built once and updated incrementally as new bars
+arrive.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# How each column is aggregated into a coarser bar
+AGGREGATIONS = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Adj Close": "last",
+    "Volume": "sum",
+}
+
+DAILY_RULES = ("W", "M")
+INTRADAY_RULES = ("H", "D")
+
+# Pyramids of the most recently requested tickers
+PYRAMID_CACHE_SIZE = 16
+_pyramids = OrderedDict()
+_pyramids_lock = threading.Lock()
+
+
+class ResamplePyramid:
+    """
+    A class used to keep resampled versions of historical prices.
+
+    Every level is resampled from the base bars, and records the first and
+    last base dates of each of its bars so that it can be mapped back to
+    trading bars. A pyramid may be shared by requests of different date
+    ranges, so levels are read through `window`, which only uses the base
+    bars of the requested range.
+
+    Methods
+    ----------
+    level(rule)
+        Resampled bars of a timeframe
+
+    window(rule, start, end)
+        Resampled bars of a timeframe over a date range only
+
+    update(data)
+        Append bars newer than the ones already in the pyramid
+
+    to_bar_ix(rule, dates)
+        Map bars of a timeframe to the indices of trading bars
+    """
+
+    def __init__(self, data, rules=DAILY_RULES):
+        """
+        Parameters
+        ----------
+        data : DataFrame
+            Contains the asset's historical prices, with a `Date` column
+        rules : tuple of str, default=("W", "M")
+            pandas offset aliases of the timeframes to keep
+        """
+        self.base = data
+        self.rules = tuple(rules)
+        self.levels = {rule: self._resample(data, rule) for rule in rules}
+        self._lock = threading.RLock()
+
+    def level(self, rule):
+        """
+        Resampled bars of a timeframe, built on first use if the rule was
+        not part of the pyramid yet.
+        """
+        with self._lock:
+            if rule not in self.levels:
+                self.levels[rule] = self._resample(self.base, rule)
+                self.rules += (rule,)
+            return self.levels[rule]
+
+    def window(self, rule, start, end):
+        """
+        Resampled bars of a timeframe as if only the base bars from `start`
+        to `end` (included) existed: bars entirely in the range come from
+        the level, and the bars cut by its bounds are resampled again from
+        the base bars in the range.
+        """
+        with self._lock:
+            level, base = self.level(rule), self.base
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        inside = level[(level["First Date"] >= start)
+                       & (level["Last Date"] <= end)]
+        if len(inside) == 0:
+            return self._resample(
+                base[(base["Date"] >= start) & (base["Date"] <= end)], rule)
+
+        head = base[(base["Date"] >= start)
+                    & (base["Date"] < inside["First Date"].iloc[0])]
+        tail = base[(base["Date"] > inside["Last Date"].iloc[-1])
+                    & (base["Date"] <= end)]
+        return pd.concat([self._resample(head, rule), inside,
+                          self._resample(tail, rule)], ignore_index=True)
+
+    def update(self, data):
+        """
+        Append bars of `data` newer than the last base bar, recomputing only
+        the last (possibly incomplete) bar of every level onwards.
+
+        Returns
+        -------
+        int
+            Number of new base bars
+        """
+        with self._lock:
+            last_date = self.base["Date"].iloc[-1]
+            new = data[data["Date"] > last_date]
+            if len(new) == 0:
+                return 0
+
+            self.base = pd.concat([self.base, new], ignore_index=True)
+            for rule, level in self.levels.items():
+                first_date = level["First Date"].iloc[-1]
+                tail = self.base[self.base["Date"] >= first_date]
+                self.levels[rule] = pd.concat(
+                    [level.iloc[:-1], self._resample(tail, rule)],
+                    ignore_index=True)
+            return len(new)
+
+    def to_bar_ix(self, rule, dates, level=None):
+        """
+        Map bars of a timeframe to the trading bars they close on.
+
+        Parameters
+        ----------
+        rule : str
+            Timeframe of the pyramid
+        dates : array-like of datetime64
+            Dates of the trading bars, sorted
+        level : DataFrame, default=None
+            Bars of the timeframe to map (e.g. from `window`), the whole
+            level if None
+
+        Returns
+        -------
+        level_ix : ndarray
+            Indices of the bars of the timeframe that close on a trading bar
+        bar_ix : ndarray
+            Indices of the matching trading bars
+        """
+        dates = np.asarray(dates)
+        if level is None:
+            level = self.level(rule)
+        last_dates = level["Last Date"].values
+        bar_ix = np.searchsorted(dates, last_dates)
+        found = bar_ix < len(dates)
+        found[found] = dates[bar_ix[found]] == last_dates[found]
+        return np.flatnonzero(found), bar_ix[found]
+
+    @staticmethod
+    def _resample(data, rule):
+        aggregations = {col: (col, how) for col, how in AGGREGATIONS.items()
+                        if col in data}
+        level = data.groupby(pd.Grouper(key="Date", freq=rule)).agg(
+            **aggregations,
+            **{"First Date": ("Date", "first"), "Last Date": ("Date", "last")})
+        level = level.dropna(subset=["Last Date"]).reset_index()
+        return level
+
+
+def get_pyramid(ticker, data, rules=DAILY_RULES):
+    """
+    Cached pyramid of a ticker, built on first request and updated with the
+    new bars of `data` afterwards. The base bars of a pyramid always cover
+    one range without holes: a pyramid whose bars do not overlap `data` is
+    built again from `data` instead.
+
+    Parameters
+    ----------
+    ticker : str
+        Asset ticker
+    data : DataFrame
+        Contains the asset's historical prices, with a `Date` column
+    rules : tuple of str, default=("W", "M")
+        pandas offset aliases of the timeframes to keep
+
+    Returns
+    -------
+    ResamplePyramid
+    """
+    first, last = data["Date"].iloc[0], data["Date"].iloc[-1]
+    with _pyramids_lock:
+        pyramid = _pyramids.get(ticker)
+        if (pyramid is None or first > pyramid.base["Date"].iloc[-1]
+                or last < pyramid.base["Date"].iloc[0]):
+            # appending disjoint bars would leave a hole between them
+            pyramid = ResamplePyramid(data, rules)
+        elif first < pyramid.base["Date"].iloc[0]:
+            base = pyramid.base
+            pyramid = ResamplePyramid(
+                pd.concat([data, base[base["Date"] > last]],
+                          ignore_index=True), pyramid.rules)
+        else:
+            pyramid.update(data)
+        _pyramids[ticker] = pyramid
+        _pyramids.move_to_end(ticker)
+        if len(_pyramids) > PYRAMID_CACHE_SIZE:
+            _pyramids.popitem(last=False)
+        return pyramid
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Broken Support Screener
+
+The script keeps, for every ticker of a universe, an index of its active
+supports (confirmed, not bought yet) and open lots, updated incrementally as
+new bars arrive, so that the tickers triggering a buy or a sell on a given
+day can be looked up without backtesting each of them again.
+"""
+import pickle
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from base_trading.backtest import SignalBook
+
+
+class SupportIndex:
+    """
+    A class used to follow the supports and positions of one ticker, one
+    bar at a time.
+
+    Unlike `BaseTrader.execute`, which finds supports with the whole
+    history at hand, a support is only confirmed once `valid_days` bars have
+    followed it, so no future prices are used.
+
+    Attributes
+    ----------
+    book : SignalBook
+        Active supports and open lots
+    last_date : Timestamp
+        Date of the last bar processed
+    last_price : float
+        Price of the last bar processed
+    signal : {"Buy", "Sell", "Buy & Sell", None}
+        What the last bar triggered
+    signals : list of tuple
+        (Date, Signal, Price) of every bar of the latest update that
+        triggered a buy or a sell
+    """
+
+    def __init__(self, trader):
+        """
+        Parameters
+        ----------
+        trader : BaseTrader
+            Provides the strategy's parameters
+        """
+        self.price = trader.price
+        self.order = int(trader.valid_days)
+        self.book = SignalBook(trader)
+        self.window = deque(maxlen=2 * self.order + 1)
+        self.n = 0
+        self.last_date, self.last_price, self.signal = None, np.nan, None
+        self.signals = []
+
+    def update(self, data):
+        """
+        Process the bars of `data` newer than the last bar processed.
+
+        Parameters
+        ----------
+        data : DataFrame
+            Contains the ticker's historical prices, with a `Date` column
+
+        Returns
+        -------
+        int
+            Number of new bars
+        """
+        if self.last_date is not None:
+            data = data[data["Date"] > self.last_date]
+        self.signals = []
+        for date, price in zip(data["Date"], data[self.price]):
+            self.step(date, price)
+        return len(data)
+
+    def step(self, date, price):
+        """
+        Process one bar.
+        """
+        self.window.append(price)
+        i = self.n
+        self.n += 1
+
+        # the bar `order` bars ago is a support if it is the lowest price
+        # of the bars around it
+        if i >= self.order:
+            candidate = self.window[-self.order - 1]
+            if all(candidate <= p for p in self.window):
+                self.book.add_support(candidate)
+
+        bought, sold = self.book.step(i, price) if i > 0 else (None, None)
+        signals = [name for name, lot in [("Buy", bought), ("Sell", sold)]
+                   if lot is not None]
+        self.signal = " & ".join(signals) or None
+        if self.signal is not None:
+            self.signals.append((date, self.signal, price))
+        self.last_date, self.last_price = date, price
+
+    @property
+    def buy_level(self):
+        """
+        Price below which the next buy is triggered (NaN if none).
+        """
+        if (len(self.book.today_sups) == 0
+                or len(self.book.bought_lots) >= self.book.max_pos):
+            return np.nan
+        return self.book.today_sups[-1] * self.book.dip_to_buy
+
+    @property
+    def sell_level(self):
+        """
+        Price above which the next sell is triggered (NaN if none).
+        """
+        if len(self.book.bought_lots) == 0:
+            return np.nan
+        return self.book.bought_lots[0][2] * self.book.hype_to_sell
+
+
+class Screener:
+    """
+    A class used to screen a universe of tickers for broken supports.
+
+    Methods
+    ----------
+    update(ticker, data)
+        Process the new bars of a ticker
+
+    update_from(collector)
+        Process the new bars of a ticker fetched by a data.Collector
+
+    triggered(date=None)
+        Tickers which triggered a buy or a sell on a date
+
+    levels()
+        Next buy/sell levels of every ticker
+
+    save(path) / load(path)
+        Persist the index between runs
+    """
+
+    def __init__(self, trader):
+        """
+        Parameters
+        ----------
+        trader : BaseTrader
+            Provides the strategy's parameters, shared by every ticker
+        """
+        self.trader = trader
+        self.indices = {}
+        self.signals = {}  # ticker -> [(date, signal, price), ...]
+
+    def update(self, ticker, data):
+        """
+        Process the bars of `data` newer than the last ones seen for
+        `ticker`.
+
+        Returns
+        -------
+        int
+            Number of new bars
+        """
+        index = self.indices.get(ticker)
+        if index is None:
+            index = self.indices[ticker] = SupportIndex(self.trader)
+        n_new = index.update(data)
+        if index.signals:
+            self.signals[ticker] = index.signals
+        else:
+            self.signals.pop(ticker, None)
+        return n_new
+
+    def update_from(self, collector):
+        """
+        Process the new bars of the ticker of a data.Collector.
+        """
+        return self.update(collector.ticker, collector.get_historical())
+
+    def triggered(self, date=None):
+        """
+        Parameters
+        ----------
+        date : str or Timestamp, default=None
+            Day to look up among the bars of the latest update of every
+            ticker, the latest bar of every ticker if None
+
+        Returns
+        -------
+        DataFrame
+            Ticker, Date, Signal and Price of every ticker which triggered a
+            buy or a sell
+        """
+        rows = [(ticker, *signal) for ticker, signals in self.signals.items()
+                for signal in signals
+                if date is not None
+                or signal[0] == self.indices[ticker].last_date]
+        triggered = pd.DataFrame(rows,
+                                 columns=["Ticker", "Date", "Signal", "Price"])
+        if date is not None:
+            triggered = triggered[triggered["Date"] == pd.to_datetime(date)]
+        return triggered.reset_index(drop=True)
+
+    def levels(self):
+        """
+        Returns
+        -------
+        DataFrame
+            Last price, next buy level and next sell level of every ticker,
+            indexed by ticker
+        """
+        return pd.DataFrame.from_dict(
+            {ticker: {"Date": index.last_date, "Price": index.last_price,
+                      "Buy Level": index.buy_level,
+                      "Sell Level": index.sell_level}
+             for ticker, index in self.indices.items()},
+            orient="index")
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Sharded Parameter Sweeps
+
+The script splits sweeps of BaseTrader parameters over many tickers into
+shards, and distributes them to worker processes (on any number of hosts)
+through a shared directory used as a work queue: workers claim shards with
+lease files that expire, write partial results, and a merge step combines
+them into one table. No broker is needed.
+
+Usage (every command takes the shared directory first):
+    python -m base_trading.sweep publish DIR sweep.json
+    python -m base_trading.sweep work DIR --data-dir data
+    python -m base_trading.sweep merge DIR
+
+where sweep.json looks like:
+    {"tickers": ["BTC-USD", "ETH-USD"], "start": "2018-01-01",
+     "end": "2021-01-01", "shards": 8,
+     "grid": {"valid_days": [10, 20], "break_support": [0.1, 0.2]}}
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import time
+import uuid
+
+import pandas as pd
+
+from base_trading.backtest import BaseTrader
+from base_trading.data import Collector, write_atomic
+
+
+def make_jobs(tickers, grid):
+    """
+    Every (ticker, parameter set) combination of a sweep, in a deterministic
+    order.
+
+    Parameters
+    ----------
+    tickers : list of str
+        Asset tickers
+    grid : dict
+        Values to try for each BaseTrader parameter
+
+    Returns
+    -------
+    list of dict
+        One job per combination, with a `ticker` key and one key per
+        parameter
+    """
+    names = sorted(grid)
+    return [{"ticker": ticker, **dict(zip(names, values))}
+            for ticker in sorted(tickers)
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def partition(jobs, n_shards):
+    """
+    Split jobs into contiguous shards of (almost) equal size, so that jobs
+    of the same ticker mostly end up in the same shard.
+
+    Returns
+    -------
+    list of list of dict
+    """
+    size, extra = divmod(len(jobs), n_shards)
+    shards, start = [], 0
+    for k in range(n_shards):
+        stop = start + size + (k < extra)
+        if stop > start:
+            shards.append(jobs[start:stop])
+        start = stop
+    return shards
+
+
+class WorkQueue:
+    """
+    A class used to share shards between workers through a directory.
+
+    Layout of the directory:
+        sweep.json            settings shared by every job
+        shards/<id>.json      jobs of each shard
+        leases/<id>.lease     worker currently processing a shard
+        results/<id>.csv      results of each processed shard
+
+    A lease expires if its worker does not renew it in time, after which
+    another worker can claim the shard, and the first worker gives it up at
+    its next renewal. Leases do not guarantee that a shard is processed by
+    a single worker (e.g. a lease taken over while its worker renews it is
+    overwritten, and both workers go on), only that duplicates are
+    harmless: results are deterministic and written to one file per
+    shard, so `merge` returns every job once.
+
+    Methods
+    ----------
+    publish(settings, shards)
+        Write the sweep settings and shards
+
+    claim(worker, lease_seconds)
+        Lease the next shard that has no results yet
+
+    renew(shard_id, worker, lease_seconds)
+        Extend a lease, if the worker still holds it
+
+    complete(shard_id, results)
+        Store the results of a shard and release its lease
+
+    merge()
+        Combine the results of every shard
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        for sub in ["shards", "leases", "results"]:
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+    def _path(self, sub, shard_id, ext):
+        return os.path.join(self.directory, sub, f"{shard_id}.{ext}")
+
+    @property
+    def shard_ids(self):
+        return sorted(name[:-len(".json")] for name in
+                      os.listdir(os.path.join(self.directory, "shards")))
+
+    @property
+    def settings(self):
+        with open(os.path.join(self.directory, "sweep.json")) as f:
+            return json.load(f)
+
+    def publish(self, settings, shards):
+        """
+        Parameters
+        ----------
+        settings : dict
+            Settings shared by every job (e.g. start and end dates)
+        shards : list of list of dict
+            Jobs of each shard, e.g. from partition()
+        """
+        write_atomic(os.path.join(self.directory, "sweep.json"),
+                     json.dumps(settings))
+        first_job = 0
+        for k, jobs in enumerate(shards):
+            jobs = [{"job": first_job + j, **job} for j, job in
+                    enumerate(jobs)]
+            write_atomic(self._path("shards", f"{k:05d}", "json"),
+                         json.dumps(jobs))
+            first_job += len(jobs)
+
+    def pending(self):
+        """
+        Ids of the shards without results yet.
+        """
+        return [shard_id for shard_id in self.shard_ids
+                if not os.path.exists(self._path("results", shard_id, "csv"))]
+
+    def claim(self, worker, lease_seconds=600):
+        """
+        Returns
+        -------
+        shard_id : str or None
+            Id of the leased shard, None if every pending shard is leased
+        jobs : list of dict
+            Jobs of the shard
+        """
+        for shard_id in self.pending():
+            lease_path = self._path("leases", shard_id, "lease")
+            if self._expired(lease_path) and not self._take_over(lease_path):
+                continue
+            try:
+                fd = os.open(lease_path,
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump({"worker": worker,
+                           "expires": time.time() + lease_seconds}, f)
+            with open(self._path("shards", shard_id, "json")) as f:
+                return shard_id, json.load(f)
+        return None, []
+
+    def renew(self, shard_id, worker, lease_seconds=600):
+        """
+        Returns
+        -------
+        bool
+            False if the lease expired and was claimed by another worker
+            meanwhile, in which case the shard should be given up. A
+            takeover between the check and the write is not detected.
+        """
+        lease_path = self._path("leases", shard_id, "lease")
+        try:
+            with open(lease_path) as f:
+                if json.load(f)["worker"] != worker:
+                    return False
+        except (FileNotFoundError, ValueError):
+            return False
+        write_atomic(lease_path,
+                     json.dumps({"worker": worker,
+                                 "expires": time.time() + lease_seconds}))
+        return True
+
+    def complete(self, shard_id, results):
+        """
+        Parameters
+        ----------
+        shard_id : str
+            Id of the shard
+        results : DataFrame
+            One row per job of the shard
+        """
+        write_atomic(self._path("results", shard_id, "csv"),
+                     results.to_csv(index=False))
+        try:
+            os.remove(self._path("leases", shard_id, "lease"))
+        except FileNotFoundError:
+            pass
+
+    def merge(self):
+        """
+        Returns
+        -------
+        DataFrame
+            Results of every processed shard, in job order
+        """
+        results = [pd.read_csv(self._path("results", shard_id, "csv"))
+                   for shard_id in self.shard_ids
+                   if os.path.exists(self._path("results", shard_id, "csv"))]
+        if not results:
+            return pd.DataFrame()
+        merged = pd.concat(results, ignore_index=True)
+        return merged.sort_values("job").reset_index(drop=True)
+
+    def _take_over(self, lease_path):
+        # only one of the workers seeing an expired lease can rename it;
+        # if the renamed lease turns out to be a new one (claimed since it
+        # was seen expired), it is put back
+        taken_path = f"{lease_path}.{uuid.uuid4().hex}.taken"
+        try:
+            os.rename(lease_path, taken_path)
+        except FileNotFoundError:
+            return False
+        expired = self._expired(taken_path)
+        if not expired:
+            try:
+                os.link(taken_path, lease_path)
+            except FileExistsError:
+                pass
+        os.remove(taken_path)
+        return expired
+
+    @staticmethod
+    def _expired(lease_path):
+        try:
+            with open(lease_path) as f:
+                return json.load(f)["expires"] < time.time()
+        except FileNotFoundError:
+            return False
+        except ValueError:
+            # lease still being written, or left corrupted by a crash
+            return time.time() - os.path.getmtime(lease_path) > 60
+
+
+def run_job(job, data, price="Close"):
+    """
+    Backtest one job of a sweep.
+
+    Returns
+    -------
+    dict
+        The job followed by the numeric performance metrics of Base
+        Trading
+    """
+    params = {name: value for name, value in job.items()
+              if name not in ("job", "ticker")}
+    price = params.pop("price", price)
+    trader = BaseTrader(price=price, **params)
+    performance = trader.compare(data, prices=(price,)).iloc[0]
+    return {**job, **performance.to_dict()}
+
+
+def run_worker(directory, data_dir="data", worker=None, lease_seconds=600,
+               poll_seconds=5):
+    """
+    Process shards of a work queue until every shard has results. Jobs
+    that fail (e.g. unavailable ticker, invalid parameter) get an `error`
+    column instead of metrics, so their shard still completes.
+
+    Parameters
+    ----------
+    directory : str
+        Shared directory of the work queue
+    data_dir : str, default="data"
+        Directory of the historical prices cached by Collector
+    worker : str, default=None
+        Worker name written in leases, "<host>-<pid>" if None
+    lease_seconds : int, default=600
+        How long a lease stays valid without being renewed
+    poll_seconds : int, default=5
+        How long to wait before looking again when every pending shard is
+        leased by other workers
+
+    Returns
+    -------
+    int
+        Number of shards processed by this worker
+    """
+    queue = WorkQueue(directory)
+    settings = queue.settings
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+    while queue.pending():
+        shard_id, jobs = queue.claim(worker, lease_seconds)
+        if shard_id is None:
+            time.sleep(poll_seconds)
+            continue
+
+        data, results = {}, []
+        for job in jobs:
+            if not queue.renew(shard_id, worker, lease_seconds):
+                break  # taken over by another worker
+            ticker = job["ticker"]
+            if ticker not in data:  # jobs of a ticker share its data
+                try:
+                    collector = Collector(
+                        ticker, settings.get("source", "yahoo"),
+                        settings["start"], settings["end"],
+                        os.path.join(data_dir, f"{ticker}.csv"))
+                    data = {ticker: collector.get_historical()}
+                except Exception as e:  # e.g. delisted ticker
+                    data = {ticker: e}
+            try:
+                if isinstance(data[ticker], Exception):
+                    raise data[ticker]
+                results.append(run_job(job, data[ticker],
+                                       settings.get("price", "Close")))
+            except Exception as e:  # failed jobs are kept, with the error
+                results.append({**job, "error": f"{type(e).__name__}: {e}"})
+        else:
+            queue.complete(shard_id, pd.DataFrame(results))
+            processed += 1
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["publish", "work", "merge"])
+    parser.add_argument("directory", help="Shared directory of the queue")
+    parser.add_argument("sweep", nargs="?", help="Sweep file (publish)")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--lease-seconds", type=int, default=600)
+    parser.add_argument("--output", help="Merged results file (merge)")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        with open(args.sweep) as f:
+            sweep = json.load(f)
+        jobs = make_jobs(sweep.pop("tickers"), sweep.pop("grid"))
+        shards = partition(jobs, sweep.pop("shards", 1))
+        WorkQueue(args.directory).publish(sweep, shards)
+        print(f"Published {len(jobs)} jobs in {len(shards)} shards.")
+    elif args.command == "work":
+        processed = run_worker(args.directory, args.data_dir,
+                               lease_seconds=args.lease_seconds)
+        print(f"Processed {processed} shards.")
+    else:
+        merged = WorkQueue(args.directory).merge()
+        output = args.output or os.path.join(args.directory, "merged.csv")
+        merged.to_csv(output, index=False)
+        print(f"Merged {len(merged)} results into {output}.")
+
+
+if __name__ == '__main__':
+    main()
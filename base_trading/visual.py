@@ -3,7 +3,7 @@
 Make Plotly Figures
 
 The script makes figures of asset prices with trading volumes, support lines, 
-entry/exit prices, cumulative performance.
+entry/exit prices, cumulative performance, drawdowns and rolling risk.
 """
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
@@ -17,12 +17,12 @@ COLORS = {
 }
 
 
-def make_figure(data, ticker, price, colors, scale="log"):
+def make_figure(data, ticker, price, colors, scale="log", trades=None):
     """
     Parameters
     ----------
     data : DataFrame
-        Contains historical prices and entries/exits processed using
+        Contains historical prices and positions processed using
         backtest.BaseTrader
     ticker : str
         Asset ticker
@@ -32,6 +32,8 @@ def make_figure(data, ticker, price, colors, scale="log"):
         Color
     scale : {"linear", "log" }, default="log"
         Sets the y-axis type of the price graph
+    trades : ndarray, default=None
+        Trade ledger of backtest.BaseTrader, used to mark entries/exits
 
     Returns
     -------
@@ -39,7 +41,8 @@ def make_figure(data, ticker, price, colors, scale="log"):
             Represents the price graph
         strat : go.Figure
             Represents the graph of portfolio balance if base trading was
-            executed
+            executed, with its drawdown, rolling volatility and rolling
+            Sharpe ratio
     """
     fig = make_subplots(rows=2, cols=1, shared_xaxes=True,
                         row_heights=[0.7, 0.3],
@@ -53,25 +56,29 @@ def make_figure(data, ticker, price, colors, scale="log"):
                                marker_color=colors['sell'])
     fig.add_trace(trace_support, row=1, col=1)
 
-    try:
-        trace_buysignals = go.Scatter(x=data['Date'], y=data['Bought Price'],
+    if trades is not None and len(trades) > 0:
+        dates = data['Date'].values
+        trace_buysignals = go.Scatter(x=dates[trades['entry_ix']],
+                                      y=trades['entry_price'],
                                       name='Buy', mode='markers',
                                       marker_color=colors['buy'],
                                       marker_symbol='triangle-up',
                                       marker_size=15)
         fig.add_trace(trace_buysignals, row=1, col=1)
-    except KeyError:
-        print("No base broken.")
 
-    try:
-        trace_sellsignals = go.Scatter(x=data['Date'], y=data['Sold Price'],
-                                       name='Sell', mode='markers',
-                                       marker_color=colors['sell'],
-                                       marker_symbol='triangle-down',
-                                       marker_size=15)
-        fig.add_trace(trace_sellsignals)
-    except KeyError:
-        print("No sell has been made. HODLING.")
+        sells = trades[trades['exit_ix'] >= 0]
+        if len(sells) > 0:
+            trace_sellsignals = go.Scatter(x=dates[sells['exit_ix']],
+                                           y=sells['exit_price'],
+                                           name='Sell', mode='markers',
+                                           marker_color=colors['sell'],
+                                           marker_symbol='triangle-down',
+                                           marker_size=15)
+            fig.add_trace(trace_sellsignals, row=1, col=1)
+        else:
+            print("No sell has been made. HODLING.")
+    else:
+        print("No base broken.")
 
     volume = go.Bar(x=data['Date'], y=data['Volume'], name='Volume',
                     opacity=1, marker_line_width=0,
@@ -83,11 +90,32 @@ def make_figure(data, ticker, price, colors, scale="log"):
         fig.update_yaxes(type=scale, dtick=0.5, row=1, col=1)
     fig.update_yaxes(row=1, col=1, tickformat=".3f")
 
+    strat = make_subplots(rows=4, cols=1, shared_xaxes=True,
+                          row_heights=[0.4, 0.2, 0.2, 0.2],
+                          subplot_titles=['Base Trading', 'Drawdown',
+                                          'Rolling Volatility',
+                                          'Rolling Sharpe'])
     trace_strat = go.Scatter(x=data['Date'], y=data['Base Trading'],
                              mode='lines', showlegend=False,
                              marker_color=colors['text'])
-    strat = go.Figure(data=[trace_strat])
-    strat.update_yaxes(rangemode="tozero", showgrid=False)
+    strat.add_trace(trace_strat, row=1, col=1)
+    strat.update_yaxes(rangemode="tozero", showgrid=False, row=1, col=1)
+
+    trace_drawdown = go.Scatter(x=data['Date'],
+                                y=data['Base Trading Drawdown'],
+                                mode='lines', fill='tozeroy',
+                                showlegend=False,
+                                marker_color=colors['sell'])
+    strat.add_trace(trace_drawdown, row=2, col=1)
+    strat.update_yaxes(tickformat=".0%", showgrid=False, row=2, col=1)
+
+    for row, col in [(3, 'Rolling Volatility'), (4, 'Rolling Sharpe')]:
+        trace = go.Scatter(x=data['Date'], y=data[f'Base Trading {col}'],
+                           mode='lines', showlegend=False,
+                           marker_color=colors['return'])
+        strat.add_trace(trace, row=row, col=1)
+        strat.update_yaxes(showgrid=False, row=row, col=1)
+    strat.update_layout(height=800)
 
     for figure in [fig, strat]:
         figure.update_layout(
@@ -100,3 +128,41 @@ def make_figure(data, ticker, price, colors, scale="log"):
         figure.update_yaxes(showline=True, automargin=True)
 
     return fig, strat
+
+
+def make_heatmap(grid, metric, colors):
+    """
+    Parameters
+    ----------
+    grid : DataFrame
+        Performance metrics indexed by (Break Support, Break Resist), as
+        returned by backtest.BaseTrader.grid, with values in %
+    metric : str
+        Column of `grid` to show
+    colors : dict
+        Color
+
+    Returns
+    -------
+        heatmap : go.Figure
+            Represents the metric over the grid, drop from support (%) on
+            the y-axis and break from support (%) on the x-axis
+    """
+    surface = grid[metric].unstack("Break Resist")
+    heatmap = go.Figure(data=go.Heatmap(
+        z=surface.values, x=surface.columns, y=surface.index,
+        colorscale=[[0, colors['sell']], [0.5, colors['text']],
+                    [1, colors['buy']]],
+        zmid=0 if surface.values.min() < 0 < surface.values.max() else None,
+        colorbar_title=metric,
+        hovertemplate=("Drop: %{y}%<br>Break: %{x}%<br>"
+                       + metric + ": %{z:.2f}<extra></extra>")))
+    heatmap.update_layout(
+        plot_bgcolor='rgba(0, 0, 0, 0)',
+        paper_bgcolor='rgba(0, 0, 0, 0)',
+        font_color=colors['text'],
+        modebar_bgcolor='#1c1e22',
+    )
+    heatmap.update_xaxes(title="Break from Support (%)", showgrid=False)
+    heatmap.update_yaxes(title="Drop from Support (%)", showgrid=False)
+    return heatmap
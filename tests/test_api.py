@@ -0,0 +1,57 @@
+"""
+The JSON API must reject batches that would take too much memory, and
+return the same results as the library.
+"""
+import importlib
+import os
+
+import pytest
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+SPEC = {"ticker": "BTC-USD", "start": "2018-01-01", "end": "2020-12-31",
+        "valid_days": 10, "fee": 0.001}
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    os.environ["PREWARM_TOP"] = "0"
+    os.environ["POPULARITY_PATH"] = str(
+        tmp_path_factory.mktemp("popularity") / "popularity.json")
+    app = importlib.import_module("app")
+    app.DATA_DIR = DATA_DIR
+    return app
+
+
+@pytest.fixture(scope="module")
+def client(app):
+    return app.server.test_client()
+
+
+def test_results_match_the_library(app, client):
+    response = client.post("/api/backtest",
+                           json={"specs": [SPEC], "equity_points": 10})
+    assert response.status_code == 200
+    result = response.get_json()["results"][0]
+
+    data = app.load_data("BTC-USD", "yahoo", SPEC["start"], SPEC["end"])
+    trader = app.BaseTrader(valid_days=10, fee=0.001)
+    performance, equity = trader.evaluate(data)
+    assert result["trades"] == len(trader.trades)
+    assert result["stats"]["Base Trading"]["Ending Cash"] == (
+        performance["Base Trading"]["Ending Cash"])
+    assert len(result["equity"]["Date"]) == 10
+
+
+def test_equity_points_are_bounded(app, client):
+    for equity_points in [1e9, -1, "many"]:
+        response = client.post("/api/backtest", json={
+            "specs": [SPEC], "equity_points": equity_points})
+        assert response.status_code == 400
+
+    # at most one point per bar
+    response = client.post("/api/backtest", json={
+        "specs": [SPEC], "equity_points": app.API_MAX_EQUITY_POINTS})
+    n_bars = len(app.load_data("BTC-USD", "yahoo", SPEC["start"],
+                               SPEC["end"]))
+    result = response.get_json()["results"][0]
+    assert len(result["equity"]["Date"]) == n_bars
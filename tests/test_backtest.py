@@ -0,0 +1,157 @@
+"""
+Invariants of the backtester: the batched, chunked and streaming paths
+must give the same results as plain single runs.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from base_trading.backtest import BaseTrader, PRICES, RETURNS, _returns
+from base_trading.data import read_blocks
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data",
+                         "BTC-USD.csv")
+
+PARAMETERS = [
+    {},
+    {"price": "Low", "valid_days": 15, "break_support": 0.05,
+     "break_resist": 0.2},
+    {"valid_days": 3, "break_support": 0.02, "break_resist": 0.03,
+     "max_pos": 2, "fee": 0.001, "slippage": 0.0005},
+    # buys a lot and sells another one on the same bar at times
+    {"valid_days": 1, "break_support": 0.01, "break_resist": 0.01,
+     "fee": 0.001, "slippage": 0.0005},
+]
+
+
+@pytest.fixture(scope="module")
+def data():
+    data = pd.read_csv(DATA_PATH, index_col=0)
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data
+
+
+def assert_frames_identical(left, right):
+    assert list(left.columns) == list(right.columns)
+    assert left.index.equals(right.index)
+    for col in left.columns:
+        np.testing.assert_array_equal(left[col].values, right[col].values,
+                                      err_msg=col)
+
+
+@pytest.mark.parametrize("params", PARAMETERS)
+@pytest.mark.parametrize("block_size", [1, 7, 97, 5000])
+def test_execute_chunked_matches_execute(data, params, block_size):
+    # block sizes smaller than valid_days included
+    trader = BaseTrader(**params)
+    expected, expected_stats = trader.execute(data)
+
+    chunked_trader = BaseTrader(**params)
+    blocks = []
+    stats = chunked_trader.execute_chunked(
+        read_blocks(DATA_PATH, block_size), blocks.append)
+
+    assert_frames_identical(expected, pd.concat(blocks))
+    assert stats.equals(expected_stats)
+    assert chunked_trader.trades.tobytes() == trader.trades.tobytes()
+
+
+def test_compare_rows_match_single_runs(data):
+    params = PARAMETERS[2]
+    trader = BaseTrader(**params)
+    compared = trader.compare(data, PRICES)
+
+    for price in PRICES:
+        single = BaseTrader(**{**params, "price": price})
+        X, stats = single.execute(data)
+        row = compared.loc[price]
+        assert row["Ending Cash"] == X["Base Trading"].iloc[-1], price
+        assert row["Trades"] == len(single.trades)
+        assert (trader.compared_trades[price].tobytes()
+                == single.trades.tobytes())
+
+
+def test_grid_rows_match_single_runs(data):
+    break_supports, break_resists = [0.05, 0.1], [0.2, 0.4]
+    grid = BaseTrader(valid_days=10).grid(data, break_supports,
+                                          break_resists)
+
+    for break_support in break_supports:
+        for break_resist in break_resists:
+            trader = BaseTrader(valid_days=10, break_support=break_support,
+                                break_resist=break_resist)
+            X, _ = trader.execute(data)
+            row = grid.loc[(break_support, break_resist)]
+            assert row["Ending Cash"] == X["Base Trading"].iloc[-1]
+            assert row["Trades"] == len(trader.trades)
+
+
+def test_returns_match_baseline(data):
+    # the original pandas computation of the returns and equity curves
+    trader = BaseTrader()
+    X, _ = trader.execute(data)
+    prices, position = X["Close"], X["Position"]
+    market_log = np.log(prices / prices.shift(1))
+    strategy_log = position.shift(1) * market_log
+    expected = {
+        "Market Log Return": market_log,
+        "Strategy Log Return": strategy_log,
+        "Buy & Hold": market_log.cumsum().apply(np.exp) * trader.init_cash,
+        "Base Trading": strategy_log.cumsum().apply(np.exp)
+        * trader.init_cash,
+    }
+    for strategy, ret in RETURNS.items():
+        expected[ret] = ((expected[strategy] - expected[strategy].shift(1))
+                         / expected[strategy])
+
+    returns = _returns(prices.values, position.values, trader.init_cash)
+    for col, values in expected.items():
+        # returns of flat bars are 0 up to rounding
+        np.testing.assert_allclose(returns[col], values.values, rtol=1e-10,
+                                   atol=1e-12, err_msg=col)
+
+
+def test_costs_lower_the_equity():
+    prices = np.array([100.0, 101.0, 102.0, 101.0, 103.0])
+    position = np.array([0.0, 0.5, 0.5, 0.0, 0.0])
+    free = _returns(prices, position, 10000)
+    costly = _returns(prices, position, 10000, cost=0.01)
+
+    # 1% of the traded half lost on the buy and on the sell
+    np.testing.assert_allclose(
+        costly["Base Trading"][-1],
+        free["Base Trading"][-1] * (1 - 0.5 * 0.01) ** 2, rtol=1e-12)
+    np.testing.assert_array_equal(costly["Buy & Hold"], free["Buy & Hold"])
+
+
+def test_costs_are_charged_on_every_trade(data):
+    trader = BaseTrader(**PARAMETERS[3])
+    X, _ = trader.execute(data)
+    trades = trader.trades
+    both = np.intersect1d(trades["entry_ix"],
+                          trades["exit_ix"][trades["exit_ix"] >= 0])
+    assert len(both) > 0
+
+    # the position is unchanged, but two lots were traded
+    position = X["Position"].values
+    np.testing.assert_array_equal(position[both], position[both - 1])
+    market_log = X["Market Log Return"].values
+    cost_log = (X["Strategy Log Return"].values[both]
+                - position[both - 1] * market_log[both])
+    np.testing.assert_allclose(
+        cost_log, np.log1p(-2 * trader.pos_size * trader.cost), rtol=1e-9)
+
+
+@pytest.mark.parametrize("params", PARAMETERS[1:])
+def test_evaluate_matches_execute(data, params):
+    trader = BaseTrader(**params)
+    X, _ = trader.execute(data)
+    trades = trader.trades
+    performance, equity = trader.evaluate(data)
+
+    assert trader.trades.tobytes() == trades.tobytes()
+    for strategy in RETURNS:
+        np.testing.assert_array_equal(equity[strategy], X[strategy].values)
+        assert performance[strategy]["Ending Cash"] == X[strategy].iloc[-1]
@@ -0,0 +1,97 @@
+"""
+The backtester must accept any columnar container, read it without copies
+and return results in the same container.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from base_trading.backtest import BaseTrader
+from base_trading.columnar import to_columns
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data",
+                         "BTC-USD.csv")
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+
+
+@pytest.fixture(scope="module")
+def data():
+    data = pd.read_csv(DATA_PATH, index_col=0)
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data[["Date"] + PRICE_COLUMNS]
+
+
+@pytest.fixture(scope="module")
+def expected(data):
+    X, _ = BaseTrader().execute(data)
+    return X
+
+
+def assert_results_match(result, expected):
+    for col in ["Support", "Position", "Base Trading"]:
+        np.testing.assert_array_equal(np.asarray(result[col]),
+                                      expected[col].values, err_msg=col)
+
+
+def test_dataframe_with_offset_index(data, expected):
+    X = data.iloc[1000:]
+    columns = to_columns(X)
+    for col in PRICE_COLUMNS:
+        assert np.shares_memory(columns[col], X[col].values)
+
+    result, _ = BaseTrader().execute(X)
+    assert isinstance(result, pd.DataFrame)
+    assert result.index.equals(X.index)
+    expected_part, _ = BaseTrader().execute(X.reset_index(drop=True))
+    assert_results_match(result, expected_part)
+
+
+def test_dataframe_with_datetime_index(data, expected):
+    X = data.set_index("Date")
+    columns = to_columns(X)
+    assert np.shares_memory(columns["Date"], X.index.values)
+    for col in PRICE_COLUMNS:
+        assert np.shares_memory(columns[col], X[col].values)
+
+    result, _ = BaseTrader().execute(X)
+    assert isinstance(result, pd.DataFrame)
+    assert result.index.equals(X.index)
+    assert "Date" not in result
+    assert_results_match(result, expected)
+
+
+def test_dict_of_arrays(data, expected):
+    X = {col: data[col].to_numpy(copy=True) for col in data.columns}
+    columns = to_columns(X)
+    for col in PRICE_COLUMNS:
+        assert np.shares_memory(columns[col], X[col])
+
+    result, _ = BaseTrader().execute(X)
+    assert isinstance(result, dict)
+    for col in X:
+        assert result[col] is X[col]
+    assert_results_match(result, expected)
+
+
+def test_arrow_table(data, expected):
+    pa = pytest.importorskip("pyarrow")
+    X = pa.Table.from_pandas(data, preserve_index=False)
+    columns = to_columns(X)
+    for col in PRICE_COLUMNS:
+        assert np.shares_memory(columns[col],
+                                X.column(col).chunk(0).to_numpy())
+
+    result, _ = BaseTrader().execute(X)
+    assert isinstance(result, pa.Table)
+    assert result.column_names[:len(X.column_names)] == X.column_names
+    for col in X.column_names:
+        assert result.column(col).chunk(0).buffers()[1].address == (
+            X.column(col).chunk(0).buffers()[1].address)
+    assert_results_match(result.to_pydict(), expected)
+
+
+def test_unsupported_container():
+    with pytest.raises(TypeError):
+        to_columns([[1.0, 2.0]])
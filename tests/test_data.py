@@ -0,0 +1,56 @@
+"""
+Concurrent requests for a ticker must share a single fetch and its result.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from base_trading import data as data_module
+from base_trading.data import Collector
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    fetches = []
+
+    def data_reader(ticker, source, start, end):
+        fetches.append((ticker, start, end))
+        time.sleep(0.2)  # let the other requesters queue up
+        dates = pd.date_range(start, end, freq="D", name="Date")
+        close = np.linspace(100, 200, len(dates))
+        return pd.DataFrame({"High": close + 1, "Low": close - 1,
+                             "Open": close, "Close": close,
+                             "Volume": 1000, "Adj Close": close},
+                            index=dates)
+
+    monkeypatch.setattr(data_module.web, "DataReader", data_reader)
+    return fetches
+
+
+def test_concurrent_requests_share_one_fetch(tmp_path, fetches):
+    data_path = str(tmp_path / "TEST.csv")
+    results = [None] * 8
+
+    def request(k):
+        collector = Collector("TEST", "yahoo", "2018-01-01", "2020-12-31",
+                              data_path)
+        results[k] = collector.get_historical()
+
+    threads = [threading.Thread(target=request, args=(k,))
+               for k in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+    for result in results[1:]:
+        pd.testing.assert_frame_equal(result, results[0])
+    # later requests are served from the cache, with the same bars
+    cached = Collector("TEST", "yahoo", "2018-01-01", "2020-12-31",
+                       data_path).get_historical()
+    pd.testing.assert_frame_equal(cached, results[0])
+    assert len(fetches) == 1
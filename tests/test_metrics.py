@@ -0,0 +1,68 @@
+"""
+Streaming analytics must give the same values whether bars are fed one at a
+time or as a whole series.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from base_trading.backtest import BaseTrader
+from base_trading.metrics import StreamingAnalytics
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data",
+                         "BTC-USD.csv")
+
+
+@pytest.fixture(scope="module")
+def data():
+    data = pd.read_csv(DATA_PATH, index_col=0)
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data
+
+
+def test_streaming_analytics_batch_matches_incremental(data):
+    X, _ = BaseTrader().execute(data)
+    returns, equity = X["Strategy Return"].values, X["Base Trading"].values
+
+    batch = StreamingAnalytics(30).run(returns, equity)
+    analytics = StreamingAnalytics(30)
+    incremental = np.array([analytics.update(ret, eq)
+                            for ret, eq in zip(returns, equity)])
+
+    for j, col in enumerate(StreamingAnalytics.COLUMNS):
+        np.testing.assert_array_equal(batch[col], incremental[:, j],
+                                      err_msg=col)
+        np.testing.assert_array_equal(X[f"Base Trading {col}"].values,
+                                      batch[col], err_msg=col)
+
+
+
+def test_streaming_analytics_match_numpy(data):
+    X, _ = BaseTrader().execute(data)
+    returns, equity = X["Market Return"].values, X["Buy & Hold"].values
+    analytics = StreamingAnalytics(30).run(returns, equity)
+
+    # population std of every full window, like np.std
+    windows = np.lib.stride_tricks.sliding_window_view(returns[1:], 30)
+    vol = np.std(windows, axis=1) * np.sqrt(365)
+    np.testing.assert_allclose(analytics["Rolling Volatility"][30:], vol,
+                               rtol=1e-9)
+    assert np.isnan(analytics["Rolling Volatility"][:30]).all()
+
+    # the equity of the first bar is not defined yet
+    drawdown = equity[1:] / np.maximum.accumulate(equity[1:]) - 1
+    np.testing.assert_allclose(analytics["Drawdown"][1:], drawdown,
+                               rtol=1e-12)
+    np.testing.assert_allclose(analytics["Max Drawdown"][1:],
+                               np.minimum.accumulate(drawdown), rtol=1e-12)
+
+
+def test_flat_returns_have_no_sharpe_ratio():
+    # a window of flat returns after moves leaves rounding in the variance
+    returns = np.concatenate([[np.nan, 0.03, -0.05, 0.02], np.zeros(40)])
+    equity = 10000 * np.exp(np.nancumsum(returns))
+    analytics = StreamingAnalytics(10).run(returns, equity)
+    assert (analytics["Rolling Volatility"][-20:] == 0).all()
+    assert np.isnan(analytics["Rolling Sharpe"][-20:]).all()
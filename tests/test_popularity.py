@@ -0,0 +1,43 @@
+"""
+Request counts of several processes sharing a file must add up, and the file
+must only keep the most requested requests.
+"""
+import multiprocessing
+
+from base_trading.popularity import PopularityTracker
+
+
+def record(path, requests):
+    tracker = PopularityTracker(path)
+    for request in requests:
+        tracker.record(request)
+    tracker.save()
+
+
+def test_processes_add_up_their_counts(tmp_path):
+    path = str(tmp_path / "popularity.json")
+    requests = [{"ticker": "BTC-USD"}] * 50 + [{"ticker": "ETH-USD"}] * 20
+    processes = [multiprocessing.Process(target=record, args=(path, requests))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    tracker = PopularityTracker(path)
+    assert tracker.top() == [{"ticker": "BTC-USD"}, {"ticker": "ETH-USD"}]
+    assert sorted(tracker.counts.values()) == [80, 200]
+
+
+def test_only_the_most_requested_are_kept(tmp_path):
+    path = str(tmp_path / "popularity.json")
+    tracker = PopularityTracker(path, keep=3)
+    for k in range(10):
+        for _ in range(k + 1):
+            tracker.record({"ticker": f"T{k}"})
+    tracker.save()
+
+    assert len(tracker.counts) == 3
+    assert PopularityTracker(path).top() == [
+        {"ticker": "T9"}, {"ticker": "T8"}, {"ticker": "T7"}]
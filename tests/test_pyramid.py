@@ -0,0 +1,65 @@
+"""
+A cached pyramid shared by requests of different date ranges must find the
+same supports as a pyramid built from the requested data alone.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from base_trading.backtest import BaseTrader
+from base_trading.pyramid import (PYRAMID_CACHE_SIZE, ResamplePyramid,
+                                  _pyramids, get_pyramid)
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data",
+                         "BTC-USD.csv")
+
+
+@pytest.fixture(scope="module")
+def data():
+    data = pd.read_csv(DATA_PATH, index_col=0)
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data
+
+
+def between(data, start, end):
+    return data[(data["Date"] >= start) & (data["Date"] <= end)]
+
+
+def supports(data, pyramid):
+    X, _ = BaseTrader(timeframe="W", valid_days=4).execute(data, pyramid)
+    return X["Support"].values
+
+
+@pytest.mark.parametrize("ranges", [
+    # gapped, then covering the gap
+    [("2016-01-01", "2017-06-30"), ("2018-01-01", "2019-12-31"),
+     ("2016-06-01", "2019-12-31")],
+    # later, then earlier and overlapping
+    [("2018-01-01", "2019-12-31"), ("2016-01-01", "2018-06-30"),
+     ("2016-06-01", "2019-12-31")],
+    # earlier, then later and overlapping
+    [("2016-01-01", "2018-06-30"), ("2018-01-01", "2019-12-31"),
+     ("2015-06-01", "2019-12-31")],
+])
+def test_cached_pyramid_matches_fresh_pyramid(data, ranges):
+    ticker = "TEST-" + "-".join(start for start, _ in ranges)
+    for start, end in ranges:
+        X = between(data, start, end)
+        pyramid = get_pyramid(ticker, X)
+        dates = pyramid.base["Date"]
+        np.testing.assert_array_equal(
+            dates.values,
+            between(data, dates.iloc[0], dates.iloc[-1])["Date"].values)
+
+        expected = supports(X, ResamplePyramid(X))
+        np.testing.assert_array_equal(supports(X, pyramid), expected)
+
+
+def test_pyramid_cache_is_bounded(data):
+    X = between(data, "2020-01-01", "2020-03-31")
+    for k in range(PYRAMID_CACHE_SIZE + 2):
+        get_pyramid(f"BOUNDED-{k}", X)
+    assert len(_pyramids) == PYRAMID_CACHE_SIZE
+    assert "BOUNDED-0" not in _pyramids
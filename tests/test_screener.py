@@ -0,0 +1,60 @@
+"""
+The screener must give the same supports, trades and signals whether bars
+arrive one update at a time or all at once.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from base_trading.backtest import BaseTrader
+from base_trading.screener import Screener
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data",
+                         "BTC-USD.csv")
+
+
+@pytest.fixture(scope="module")
+def data():
+    data = pd.read_csv(DATA_PATH, index_col=0)
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data.drop_duplicates("Date").reset_index(drop=True)
+
+
+@pytest.fixture
+def trader():
+    return BaseTrader(valid_days=5, break_support=0.05, break_resist=0.1)
+
+
+def test_updates_match_single_update(data, trader):
+    screener = Screener(trader)
+    screener.update("BTC-USD", data)
+
+    updated = Screener(trader)
+    signals = []
+    for end in [500, 501, 1200, len(data)]:
+        # the history so far, like a collector would return it
+        updated.update("BTC-USD", data.iloc[:end])
+        signals += updated.signals.get("BTC-USD", [])
+
+    assert (updated.indices["BTC-USD"].book.ledger().tobytes()
+            == screener.indices["BTC-USD"].book.ledger().tobytes())
+    pd.testing.assert_frame_equal(updated.levels(), screener.levels())
+    assert signals == screener.signals["BTC-USD"]
+
+
+def test_triggered_finds_every_bar_of_an_update(data, trader):
+    screener = Screener(trader)
+    screener.update("BTC-USD", data)
+    signals = screener.signals["BTC-USD"]
+    assert len(signals) > 1
+
+    date, signal, price = signals[0]
+    assert date != screener.indices["BTC-USD"].last_date
+    triggered = screener.triggered(date)
+    assert triggered.to_dict("records") == [
+        {"Ticker": "BTC-USD", "Date": date, "Signal": signal,
+         "Price": price}]
+    # only the signals of the latest bar without a date
+    assert (screener.triggered()["Date"]
+            == screener.indices["BTC-USD"].last_date).all()
@@ -0,0 +1,95 @@
+"""
+Several worker processes sharing a work queue directory must process every
+job of a sweep, and leases must only be taken over once they expired.
+"""
+import multiprocessing
+import os
+import shutil
+import threading
+
+from base_trading.sweep import WorkQueue, make_jobs, partition, run_worker
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data",
+                         "BTC-USD.csv")
+SETTINGS = {"start": "2018-01-01", "end": "2020-12-31"}
+
+
+def publish(directory, grid, n_shards):
+    jobs = make_jobs(["BTC-USD"], grid)
+    WorkQueue(directory).publish(SETTINGS, partition(jobs, n_shards))
+    return jobs
+
+
+def test_workers_process_every_job_once(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    shutil.copy(DATA_PATH, data_dir)
+    directory = str(tmp_path / "queue")
+    # max_pos=0 fails, and is kept with its error
+    jobs = publish(directory, {"valid_days": [5, 10, 20],
+                               "break_support": [0.05, 0.1],
+                               "max_pos": [0, 5]}, 5)
+
+    workers = [multiprocessing.Process(
+        target=run_worker, args=(directory, str(data_dir)),
+        kwargs={"worker": f"worker-{k}", "poll_seconds": 0.1})
+        for k in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+        assert worker.exitcode == 0
+
+    queue = WorkQueue(directory)
+    merged = queue.merge()
+    assert queue.pending() == []
+    assert merged["job"].tolist() == list(range(len(jobs)))
+    params = merged[["ticker", "valid_days", "break_support", "max_pos"]]
+    assert params.to_dict("records") == jobs
+    failed = merged["max_pos"] == 0
+    assert merged.loc[failed, "error"].str.startswith(
+        "ZeroDivisionError").all()
+    assert merged.loc[~failed, "error"].isna().all()
+    assert merged.loc[~failed, "Ending Cash"].notna().all()
+    assert os.listdir(os.path.join(directory, "leases")) == []
+
+
+def test_claim_takes_over_expired_leases_only(tmp_path):
+    directory = str(tmp_path)
+    publish(directory, {"valid_days": [5, 10]}, 2)
+    queue = WorkQueue(directory)
+
+    first, _ = queue.claim("a", lease_seconds=600)
+    second, _ = queue.claim("b", lease_seconds=-1)  # expired at once
+    assert first != second
+
+    assert queue.claim("c")[0] == second
+    assert queue.claim("d")[0] is None
+    assert not queue.renew(second, "b")
+    assert queue.renew(second, "c")
+    assert queue.renew(first, "a")
+
+
+def test_one_worker_takes_over_an_expired_lease(tmp_path):
+    directory = str(tmp_path)
+    publish(directory, {"valid_days": [5]}, 1)
+    queue = WorkQueue(directory)
+
+    for _ in range(20):
+        shard_id, _ = queue.claim("expired", lease_seconds=-1)
+        barrier = threading.Barrier(8)
+        claimed = []
+
+        def claim(k):
+            barrier.wait()
+            claimed.append(queue.claim(f"worker-{k}")[0])
+
+        threads = [threading.Thread(target=claim, args=(k,))
+                   for k in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert claimed.count(shard_id) == 1
+        assert claimed.count(None) == 7
+        os.remove(queue._path("leases", shard_id, "lease"))